@@ -0,0 +1,274 @@
+import argparse
+import ast
+import contextlib
+import datetime
+import http.server
+import io
+import json
+import os
+import platform
+import shutil
+import socketserver
+import subprocess
+import tempfile
+import threading
+import time
+from synthetic_catalog import make_catalog
+
+# benchmarks the scheduler, renderer and scraper on synthetic catalogs and writes the timings as
+# json, e.g.
+#   python benchmark.py --output before.json
+#   python benchmark.py --output after.json --compare before.json
+
+SIZES = {
+    'small': {'departments': 6, 'courses_per_department': 4},
+    'medium': {'departments': 12, 'courses_per_department': 8},
+    'large': {'departments': 25, 'courses_per_department': 12}
+}
+
+# constraint mixes run at every num_courses, written with the departments of the catalog
+def constraint_mixes(departments):
+    return {
+        'none': {},
+        'exclude': {'exclude': [departments[0], departments[1]]},
+        'counts': {'at_least': [{'Courses': departments[:3], 'Number': 1}], 'at_most': [{'Courses': departments[3:6], 'Number': 1}]},
+        'limits': {'day_limits': {'Monday': 2, 'Friday': 1}, 'time_limits': [('7:00 AM', '9:30 AM'), ('6:00 PM', '11:00 PM')]}
+    }
+
+DAY_CODES = {'Monday': 'M', 'Tuesday': 'T', 'Wednesday': 'W', 'Thursday': 'Th', 'Friday': 'F'}
+
+class StubCatalogServer:
+    # serves a catalog on localhost with the markup of the course site, so the scraper can be
+    # timed without touching the network
+    def __init__(self, catalog, latency=0.01):
+        pages = dict()
+        for department, courses in catalog.groupby('Department'):
+            items = []
+            for (course, name), sections in courses.groupby(['Course', 'Name']):
+                items.append(f'<li class="kgoui_object"><a href="/course/{department}{course}"><span class="kgoui_list_item_title">{department} {course}: {name}</span></a></li>')
+
+                details = []
+                for idx, row in sections.iterrows():
+                    days = ''.join(DAY_CODES[day] for day in ast.literal_eval(row['Days']))
+                    start = datetime.datetime.strptime(row['Start'], '%H:%M:%S').strftime('%I:%M %p')
+                    end = datetime.datetime.strptime(row['End'], '%H:%M:%S').strftime('%I:%M %p')
+                    details.append(f'<div class="kgoui_object"><span>Section: {row["Section"]}</span><span>Schedule: {days} {start}-{end}</span></div>')
+                pages[f'/course/{department}{course}'] = f'<div id="kgoui_Rcontent_I1_Rcontent_I0_Rsections">{"".join(details)}</div>'.encode()
+
+            pages[f'/default/courses/catalog?area={department}'] = f'<ul>{"".join(items)}</ul>'.encode()
+
+        self.requests = 0
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                server.requests += 1
+                time.sleep(latency)
+                body = pages.get(self.path, b'')
+                self.send_response(200 if self.path in pages else 404)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        class Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+            daemon_threads = True
+
+        self.httpd = Server(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+def timed(function, repeat):
+    # the best of repeat runs, along with what the last run returned
+    best = None
+    for attempt in range(repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def bench_construction(catalog, directory, repeat):
+    from make_schedules import ScheduleMaker
+
+    results = []
+    seconds, maker = timed(lambda: ScheduleMaker(catalog.copy()), repeat)
+    results.append({'name': 'construct/dataframe', 'seconds': seconds, 'sections': len(catalog)})
+
+    compiled_path = os.path.join(directory, 'catalog.catalog')
+    maker.save_catalog(compiled_path)
+    seconds, maker = timed(lambda: ScheduleMaker(compiled_path), repeat)
+    results.append({'name': 'construct/compiled', 'seconds': seconds, 'sections': len(catalog)})
+    return results
+
+def bench_generate(catalog, num_courses, limit, workers, repeat):
+    from make_schedules import ScheduleMaker
+
+    results = []
+    departments = sorted(catalog['Department'].unique())
+    for mix, params in constraint_mixes(departments).items():
+        for courses in num_courses:
+            def run():
+                maker = ScheduleMaker(catalog.copy(), num_courses=courses, **params)
+                return maker.generate_schedules(limit=limit, workers=workers)
+
+            seconds, count = timed(run, repeat)
+            results.append({'name': f'generate/{mix}/{courses}', 'seconds': seconds, 'schedules': count, 'num_courses': courses, 'constraints': mix})
+
+            def count_all():
+                maker = ScheduleMaker(catalog.copy(), num_courses=courses, **params)
+                return maker.count_schedules()
+
+            seconds, counts = timed(count_all, repeat)
+            results.append({'name': f'count/{mix}/{courses}', 'seconds': seconds, 'schedules': counts['Schedules'], 'course_sets': counts['Course Sets'], 'num_courses': courses, 'constraints': mix})
+    return results
+
+def bench_draw(catalog, directory, images, font):
+    from make_schedules import ScheduleMaker
+
+    maker = ScheduleMaker(catalog.copy(), num_courses=4)
+    with contextlib.redirect_stdout(io.StringIO()):
+        maker.generate_schedules(limit=images)
+    maker.results = maker.results[:images]
+
+    results = []
+    previous = os.getcwd()
+    # the renderer looks for arial.ttf, so run where the font can be found
+    os.chdir(directory)
+    try:
+        if font is not None:
+            shutil.copyfile(font, 'arial.ttf')
+        for output in ['png', 'svg', 'pdf']:
+            shutil.rmtree('images', ignore_errors=True)
+            seconds, ignored = timed(lambda: maker.draw_schedules(directory='images', output=output), 1)
+            results.append({'name': f'draw/{output}', 'seconds': seconds, 'images': len(maker.results), 'seconds_per_image': seconds / max(len(maker.results), 1)})
+    except OSError as error:
+        results.append({'name': 'draw', 'skipped': f"no font to draw with ({error}), pass --font"})
+    finally:
+        os.chdir(previous)
+    return results
+
+def bench_scrape(catalog, directory, courses, workers, latency):
+    from get_schedules import CourseInfoScraper
+
+    wishlist = catalog.drop_duplicates(['Department', 'Course']).head(courses)[['Department', 'Course']]
+    results = []
+    with StubCatalogServer(catalog, latency) as server:
+        for count in sorted({1, workers}):
+            for cached in [False, True]:
+                cache_dir = os.path.join(directory, f'http_cache_{count}') if cached else None
+                server.requests = 0
+                scraper = CourseInfoScraper(wishlist.copy(), None, workers=count, catalog_url=server.url, course_url=server.url, cache_dir=cache_dir)
+                seconds, ignored = timed(scraper.scrape_course_info, 1)
+                results.append({'name': f'scrape/workers{count}' + ('/cold' if cached else ''), 'seconds': seconds, 'courses': len(wishlist), 'requests': server.requests,
+                                'sections': len(scraper.schedules_df)})
+
+            # a second scrape with the cache warm
+            server.requests = 0
+            scraper = CourseInfoScraper(wishlist.copy(), None, workers=count, catalog_url=server.url, course_url=server.url, cache_dir=os.path.join(directory, f'http_cache_{count}'))
+            seconds, ignored = timed(scraper.scrape_course_info, 1)
+            results.append({'name': f'scrape/workers{count}/warm', 'seconds': seconds, 'courses': len(wishlist), 'requests': server.requests, 'sections': len(scraper.schedules_df)})
+    return results
+
+def compare(results, baseline_path, tolerance, min_seconds):
+    # benchmarks that got more than tolerance slower than in the baseline file, ignoring changes
+    # under min_seconds that are just noise
+    with open(baseline_path) as baseline_file:
+        baseline = {result['name']: result for result in json.load(baseline_file)['results'] if 'seconds' in result}
+
+    regressions = []
+    for result in results:
+        before = baseline.get(result['name'])
+        if before is not None and 'seconds' in result and result['seconds'] > before['seconds'] * (1 + tolerance) and result['seconds'] - before['seconds'] >= min_seconds:
+            regressions.append((result['name'], before['seconds'], result['seconds']))
+    return regressions
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Time ScheduleMaker, the renderer and the scraper on a synthetic catalog")
+    parser.add_argument('--size', choices=SIZES, default='medium')
+    parser.add_argument('--departments', type=int, help="overrides the size")
+    parser.add_argument('--courses-per-department', type=int, help="overrides the size")
+    parser.add_argument('--precepts', type=int, default=6, help="most precepts per course")
+    parser.add_argument('--shared-times', type=float, default=0.0, help="chance a section meets at the same time as an earlier one of its type")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--num-courses', type=int, nargs='+', default=[3, 4, 5])
+    parser.add_argument('--limit', type=int, default=20000, help="most schedules generated per run")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--repeat', type=int, default=3, help="runs per timing, the best is kept")
+    parser.add_argument('--images', type=int, default=5)
+    parser.add_argument('--font', help="a .ttf to draw with when arial.ttf isn't available")
+    parser.add_argument('--scrape-courses', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.01, help="seconds the stub server waits per request")
+    parser.add_argument('--only', nargs='+', choices=['construct', 'generate', 'draw', 'scrape'], default=['construct', 'generate', 'draw', 'scrape'])
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', help="an earlier output file to check for regressions against")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="how much slower than the baseline counts as a regression")
+    parser.add_argument('--min-seconds', type=float, default=0.01, help="smallest slowdown that counts as a regression")
+    args = parser.parse_args()
+
+    size = dict(SIZES[args.size])
+    if args.departments is not None:
+        size['departments'] = args.departments
+    if args.courses_per_department is not None:
+        size['courses_per_department'] = args.courses_per_department
+    catalog = make_catalog(sections_per_type={'L': (1, 2), 'P': (0, args.precepts), 'C': (0, 0), 'B': (0, 1), 'S': (0, 0)}, seed=args.seed, shared_times=args.shared_times, **size)
+    print(f"Synthetic catalog: {size['departments']} departments, {catalog[['Department', 'Course']].drop_duplicates().shape[0]} courses, {len(catalog)} sections")
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        if 'construct' in args.only:
+            results += bench_construction(catalog, directory, args.repeat)
+        if 'generate' in args.only:
+            results += bench_generate(catalog, args.num_courses, args.limit, args.workers, args.repeat)
+        if 'draw' in args.only:
+            results += bench_draw(catalog, directory, args.images, args.font)
+        if 'scrape' in args.only:
+            results += bench_scrape(catalog, directory, args.scrape_courses, args.workers or 4, args.latency)
+
+    for result in results:
+        if 'seconds' in result:
+            print(f"{result['name']:<32} {result['seconds']:.4f}s")
+        else:
+            print(f"{result['name']:<32} skipped: {result['skipped']}")
+
+    output = {
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'catalog': {'seed': args.seed, 'shared_times': args.shared_times, 'sections': len(catalog), **size},
+        'arguments': vars(args),
+        'results': results
+    }
+    with open(args.output, 'w') as output_file:
+        json.dump(output, output_file, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare is not None:
+        regressions = compare(results, args.compare, args.tolerance, args.min_seconds)
+        for name, before, after in regressions:
+            print(f"REGRESSION {name}: {before:.4f}s -> {after:.4f}s")
+        if regressions:
+            raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+import sqlite3
+import pandas as pd
+
+COLUMNS = ['Department', 'Course', 'Name', 'Section', 'Days', 'Start', 'End']
+# paths with these extensions are catalog stores, anything else is read and written as xlsx
+STORE_EXTENSIONS = ('.db', '.sqlite', '.sqlite3')
+
+def is_store_path(path):
+    return isinstance(path, str) and path.lower().endswith(STORE_EXTENSIONS)
+
+class CatalogStore:
+    # the scraped catalog in sqlite, one row per section keyed by Department/Course/Section.
+    # writes are bulk upserts in a single transaction, and whether a course was already scraped
+    # is an index lookup instead of a scan of the whole catalog
+    def __init__(self, path='catalog.db'):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS sections (
+            Department TEXT NOT NULL,
+            Course INTEGER NOT NULL,
+            Name TEXT,
+            Section TEXT NOT NULL,
+            Days TEXT,
+            Start TEXT,
+            End TEXT,
+            PRIMARY KEY (Department, Course, Section))''')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS sections_name ON sections (Name)')
+        self.connection.commit()
+
+    def __rows(self, df):
+        # stored the way schedules.xlsx has them: Days as a stringified list, times as HH:MM:SS
+        for department, course, name, section, days, start, end in df[COLUMNS].itertuples(index=False):
+            yield (department, int(course), name, section, days if isinstance(days, str) else str(list(days)), str(start), str(end))
+
+    def upsert(self, df):
+        # adds new sections and overwrites the name, days and times of ones already stored
+        if 'Name' not in df.columns:
+            df = df.assign(Name=None)
+
+        with self.connection:
+            cursor = self.connection.executemany('''INSERT INTO sections (Department, Course, Name, Section, Days, Start, End)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (Department, Course, Section) DO UPDATE SET
+                Name = excluded.Name, Days = excluded.Days, Start = excluded.Start, End = excluded.End''', self.__rows(df))
+
+        return cursor.rowcount
+
+    def has_course(self, department, course):
+        return self.connection.execute('SELECT 1 FROM sections WHERE Department = ? AND Course = ? LIMIT 1', (department, int(course))).fetchone() is not None
+
+    def has_name(self, name):
+        return self.connection.execute('SELECT 1 FROM sections WHERE Name = ? LIMIT 1', (name,)).fetchone() is not None
+
+    def scraped(self, course):
+        # course is either a code like CHI108 or a course name, the way classes.xlsx lists them
+        if len(course) > 3 and course[:3].isalpha() and course[3:].isdigit():
+            return self.has_course(course[:3], course[3:])
+        return self.has_name(course)
+
+    def delete_course(self, department, course):
+        with self.connection:
+            self.connection.execute('DELETE FROM sections WHERE Department = ? AND Course = ?', (department, int(course)))
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM sections').fetchone()[0]
+
+    def load(self):
+        return pd.read_sql_query('SELECT Department, Course, Name, Section, Days, Start, End FROM sections ORDER BY rowid', self.connection)
+
+    def import_excel(self, filename='schedules.xlsx'):
+        return self.upsert(pd.read_excel(filename))
+
+    def export_excel(self, filename='schedules.xlsx'):
+        self.load().to_excel(filename, index=False)
+
+    def close(self):
+        self.connection.close()
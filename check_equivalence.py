@@ -0,0 +1,244 @@
+import argparse
+import ast
+import collections
+import contextlib
+import datetime
+import io
+import itertools
+import pandas as pd
+from synthetic_catalog import make_catalog
+from make_schedules import ScheduleMaker, SCORERS
+
+# checks ScheduleMaker against a brute force enumeration written the way the original engine
+# worked: every combination of courses, every section of every group, the overlap, time limit
+# and day limit tests done on the catalog's own strings. generate_schedules, iter_schedules,
+# count_schedules and best_schedules all have to give exactly what it gives, in the same order, e.g.
+#   python check_equivalence.py
+#   python check_equivalence.py --seeds 10 --catalog schedules.xlsx
+
+def to_minutes(value, format='%H:%M:%S'):
+    if not isinstance(value, str):
+        return value.hour * 60 + value.minute
+    value = datetime.datetime.strptime(value, format)
+    return value.hour * 60 + value.minute
+
+class BruteForce:
+    # every schedule of a catalog, combination by combination, in the order the schedules have
+    # always come out in
+    def __init__(self, catalog, params):
+        self.catalog = catalog.reset_index(drop=True)
+        self.catalog['Days'] = self.catalog['Days'].apply(lambda days: ast.literal_eval(days) if isinstance(days, str) else days)
+        self.params = params
+        self.days = list(self.catalog['Days'])
+        self.starts = [to_minutes(start) for start in self.catalog['Start']]
+        self.ends = [to_minutes(end) for end in self.catalog['End']]
+        self.names = [department + str(course) for department, course in zip(self.catalog['Department'], self.catalog['Course'])]
+        self.keys = [name + section[0] for name, section in zip(self.names, self.catalog['Section'])]
+        self.courses = sorted(set(zip(self.catalog['Department'], self.catalog['Course'])))
+        # each course's Name and the days and times its sections meet, which the listings of a
+        # cross listed course all share
+        self.listings = dict()
+        for row, name in enumerate(self.names):
+            self.listings.setdefault(name, (self.catalog['Name'][row], set()))[1].add((frozenset(self.days[row]), self.starts[row], self.ends[row]))
+
+    def __allowed(self, combo):
+        names = [department + str(course) for department, course in combo]
+        count = lambda courses: sum(any(course in name for course in courses) for name in names)
+
+        if any(department == excluded or name == excluded for (department, course), name in zip(combo, names) for excluded in self.params.get('exclude', [])):
+            return False
+        if not all(count([must_have]) >= 1 for must_have in self.params.get('must_haves', [])):
+            return False
+        if not all(count(rule['Courses']) >= rule['Number'] for rule in self.params.get('at_least', [])):
+            return False
+        if not all(count(rule['Courses']) <= rule['Number'] for rule in self.params.get('at_most', [])):
+            return False
+        if not all(count(rule['Courses']) == rule['Number'] for rule in self.params.get('must_select', [])):
+            return False
+        if self.params.get('unique_deps', True) and len(set(department for department, course in combo)) < len(combo):
+            return False
+        if self.params.get('unique_listings', True):
+            listings = [(self.listings[name][0], frozenset(self.listings[name][1])) for name in names]
+            if len(set(listings)) < len(listings):
+                return False
+        return True
+
+    def __fits(self, schedule):
+        time_limits = [(to_minutes(start, '%I:%M %p'), to_minutes(end, '%I:%M %p')) for start, end in self.params.get('time_limits', [])]
+        for row in schedule:
+            if any(self.starts[row] < end and self.ends[row] > start for start, end in time_limits):
+                return False
+        for first, second in itertools.combinations(schedule, 2):
+            if set(self.days[first]) & set(self.days[second]) and self.ends[first] >= self.starts[second] and self.starts[first] <= self.ends[second]:
+                return False
+        days = collections.Counter(day for row in schedule for day in self.days[row])
+        return all(days[day] <= day_limit for day, day_limit in self.params.get('day_limits', {}).items())
+
+    def __groups(self, combo):
+        # the combination's sections sorted by how many sections their group has, the way
+        # sort_values(by=['Count']) left them, then split into groups in that order
+        rows = [row for row, name in enumerate(zip(self.catalog['Department'], self.catalog['Course'])) if name in combo]
+        sizes = collections.Counter(self.keys[row] for row in rows)
+        frame = pd.DataFrame({'Row': rows, 'Count': [sizes[self.keys[row]] for row in rows]}).sort_values(by=['Count'])
+        groups = dict()
+        for row in frame['Row']:
+            groups.setdefault(self.keys[row], []).append(row)
+        return list(groups.values())
+
+    def combinations(self):
+        # (combination, its schedules as catalog rows in group order, the schedules only of
+        # representatives) for every combination
+        for combo in itertools.combinations(self.courses, self.params.get('num_courses', 6)):
+            if self.__allowed(combo):
+                groups = self.__groups(combo)
+                schedules = [schedule for schedule in itertools.product(*groups) if self.__fits(schedule)]
+                yield combo, schedules, [schedule for schedule in schedules if self.__representative(schedule, groups)]
+
+    def __representative(self, schedule, groups):
+        # whether every section is the first of its group, in search order, to meet at its times
+        for row, group in zip(schedule, groups):
+            for other in group[:group.index(row)]:
+                if self.days[other] == self.days[row] and (self.starts[other], self.ends[other]) == (self.starts[row], self.ends[row]):
+                    return False
+        return True
+
+    def score(self, schedule, preferences):
+        day_times = dict()
+        for row in schedule:
+            for day in self.days[row]:
+                day_times.setdefault(day, []).append((self.starts[row], self.ends[row]))
+        for times in day_times.values():
+            times.sort()
+        frame = self.catalog.iloc[list(schedule)]
+        return sum(weight * (scorer(frame) if callable(scorer) else SCORERS[scorer](day_times)) for scorer, weight in preferences.items())
+
+def quietly(function):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return function()
+
+def check(catalog, params, workers, label):
+    # the mismatches between ScheduleMaker and the brute force for one catalog and parameters
+    brute = BruteForce(catalog.copy(), params)
+    combos = list(brute.combinations())
+    everything = [schedule for combo, schedules, representatives in combos for schedule in schedules]
+    make = lambda: ScheduleMaker(catalog.copy(), **params)
+    rows = lambda maker: [maker.results.schedule_rows(index) for index in range(len(maker.results))]
+    failures = []
+
+    for per_combo in [None, 1, 2]:
+        for worker_count in [None] + ([workers] if workers is not None and workers > 1 else []):
+            maker = make()
+            quietly(lambda: maker.generate_schedules(per_combo=per_combo, workers=worker_count))
+            want = [schedule for combo, schedules, representatives in combos for schedule in (schedules if per_combo is None else schedules[:per_combo])]
+            if rows(maker) != want:
+                failures.append(f"{label}: generate_schedules(per_combo={per_combo}, workers={worker_count}) found {len(maker.results)} schedules, expected {len(want)}")
+
+    maker = make()
+    quietly(lambda: maker.generate_schedules(per_combo=None, expand=False))
+    want = [schedule for combo, schedules, representatives in combos for schedule in representatives]
+    if rows(maker) != want:
+        failures.append(f"{label}: generate_schedules(expand=False) found {len(maker.results)} schedules, expected {len(want)}")
+
+    maker = make()
+    limit = max(len(everything) // 3, 1)
+    first = quietly(lambda: [frame for frame in maker.iter_schedules(limit=limit)])
+    if len(first) != min(limit, len(everything)):
+        failures.append(f"{label}: iter_schedules(limit={limit}) gave {len(first)} schedules")
+    else:
+        whole = make()
+        quietly(lambda: whole.generate_schedules(per_combo=None))
+        if not all(frame.equals(whole.results[index]) for index, frame in enumerate(first)):
+            failures.append(f"{label}: iter_schedules(limit={limit}) differs from generate_schedules")
+
+    counts = quietly(lambda: make().count_schedules())
+    if counts != {'Course Sets': sum(1 for combo, schedules, representatives in combos if schedules), 'Schedules': len(everything)}:
+        failures.append(f"{label}: count_schedules gave {counts}, expected {len(everything)} schedules")
+    for by in ['Course', 'Department']:
+        breakdown = quietly(lambda: make().count_schedules(by=by))
+        want = collections.Counter()
+        for combo, schedules, representatives in combos:
+            for name in {department + str(course) if by == 'Course' else department for department, course in combo}:
+                want[name] += len(schedules)
+        got = {name: count for name, count in zip(breakdown[by], breakdown['Schedules']) if count}
+        if got != dict(+want):
+            failures.append(f"{label}: count_schedules(by={by}) differs")
+
+    # a scorer of its own makes every schedule a frame, so it is only tried the once
+    preferences = {'idle_minutes': 1, 'days': 30, 'early_start': 0.5}
+    runs = [(preferences, top_k, worker_count) for top_k in [1, 5] for worker_count in [None] + ([workers] if workers is not None and workers > 1 else [])]
+    runs.append(({**preferences, (lambda frame: len(frame)): 1}, 5, None))
+    for preferences, top_k, worker_count in runs:
+        maker = ScheduleMaker(catalog.copy(), **dict(params, preferences=preferences))
+        quietly(lambda: maker.best_schedules(top_k, workers=worker_count))
+        # among equal scores the schedule found first wins
+        scored = sorted((round(brute.score(schedule, preferences), 6), order, schedule) for order, schedule in enumerate(everything))[:top_k]
+        if [round(score, 6) for score in maker.scores] != [score for score, order, schedule in scored] or rows(maker) != [schedule for score, order, schedule in scored]:
+            failures.append(f"{label}: best_schedules({top_k}, workers={worker_count}, {len(preferences)} preferences) differs")
+
+    return failures
+
+def cases(departments):
+    first, second, third = departments[:3]
+    return {
+        'plain': {'num_courses': 3},
+        'two': {'num_courses': 2},
+        'time limits': {'num_courses': 3, 'time_limits': [('7:00 AM', '9:30 AM'), ('12:00 PM', '1:00 PM')]},
+        'day limits': {'num_courses': 3, 'day_limits': {'Monday': 2, 'Friday': 1}},
+        'day off': {'num_courses': 2, 'day_limits': {'Friday': 0, 'Tuesday': 2}},
+        'rules': {'num_courses': 3, 'exclude': [first], 'must_haves': [second], 'at_most': [{'Courses': [third], 'Number': 1}]},
+        'select': {'num_courses': 3, 'at_least': [{'Courses': [first, second], 'Number': 1}], 'must_select': [{'Courses': [third], 'Number': 1}]},
+        'same dept': {'num_courses': 3, 'unique_deps': False, 'must_haves': [first]},
+        'everything': {'num_courses': 3, 'exclude': [third], 'day_limits': {'Wednesday': 2}, 'time_limits': [('6:00 PM', '11:00 PM')]}
+    }
+
+def with_listings(catalog):
+    # the catalog with its first course cross listed in the last department, and the next two
+    # given the same generic title without being listings of one course
+    catalog = catalog.copy()
+    courses = sorted(set(zip(catalog['Department'], catalog['Course'])))
+    listing = catalog[(catalog['Department'] == courses[0][0]) & (catalog['Course'] == courses[0][1])].copy()
+    listing['Department'] = courses[-1][0]
+    listing['Course'] = 999
+    for department, course in courses[1:3]:
+        catalog.loc[(catalog['Department'] == department) & (catalog['Course'] == course), 'Name'] = 'Junior Seminar'
+    return pd.concat([catalog, listing], ignore_index=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Check ScheduleMaker against a brute force enumeration")
+    parser.add_argument('--seeds', type=int, default=3, help="synthetic catalogs to check")
+    parser.add_argument('--departments', type=int, default=4)
+    parser.add_argument('--courses-per-department', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--catalog', help="also check a few courses of this catalog")
+    args = parser.parse_args()
+
+    catalogs = []
+    for seed in range(args.seeds):
+        catalogs.append((f"seed {seed}", make_catalog(args.departments, args.courses_per_department, seed=seed, shared_times=0.4 if seed % 2 else 0.0)))
+    if args.seeds:
+        catalogs.append(("cross listed", with_listings(catalogs[0][1])))
+    if args.catalog is not None:
+        catalog = ScheduleMaker(args.catalog).schedules
+        courses = sorted(set(zip(catalog['Department'], catalog['Course'])))[:12]
+        catalog = catalog[[course in courses for course in zip(catalog['Department'], catalog['Course'])]].copy()
+        catalog['Days'] = catalog['Days'].apply(str)
+        catalogs.append((args.catalog, catalog))
+
+    failures = []
+    for name, catalog in catalogs:
+        checked = cases(sorted(catalog['Department'].unique()))
+        if name == "cross listed":
+            checked = {'plain': checked['plain'], 'not unique': dict(checked['plain'], unique_listings=False)}
+        for case, params in checked.items():
+            found = check(catalog, params, args.workers, f"{name}, {case}")
+            failures += found
+            print(f"{name:<16} {case:<12} {'ok' if not found else 'MISMATCH'}")
+
+    for failure in failures:
+        print(failure)
+    if failures:
+        raise SystemExit(1)
+    print("Every check matches the brute force enumeration")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+import ast
+import datetime
+import json
+import numpy as np
+import pandas as pd
+
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+# compiled catalogs are saved with this extension
+CATALOG_EXTENSION = '.catalog'
+
+# file layout: magic, format version, header length, a json header with the string tables and
+# where each array is, then the arrays themselves, each aligned so they can be mapped in place
+MAGIC = b'SCHEDCAT'
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+
+# name, dtype and what it holds for every array in a compiled catalog, one entry per section
+ARRAYS = [
+    ('department_codes', np.int32),  # index into departments
+    ('course_numbers', np.int32),
+    ('course_ids', np.int32),  # index into courses, which are sorted
+    ('name_codes', np.int32),  # index into names
+    ('section_codes', np.int32),  # index into sections
+    ('group_ids', np.int32),  # index into groups, a course and section type (lecture, precept, ...)
+    ('day_bits', np.uint8),  # bit i set when the section meets on DAYS[i]
+    ('starts', np.int16),  # minutes after midnight
+    ('ends', np.int16)
+]
+
+def is_catalog_path(path):
+    return isinstance(path, str) and path.lower().endswith(CATALOG_EXTENSION)
+
+def to_minutes(value):
+    if isinstance(value, str):
+        value = datetime.datetime.strptime(value, '%H:%M:%S')
+    return value.hour * 60 + value.minute
+
+class CompiledCatalog:
+    # the catalog normalized once into typed arrays and string tables, so a ScheduleMaker can start
+    # from it without parsing any Days lists or times
+    def __init__(self, tables, arrays):
+        self.departments = tables['departments']
+        self.names = tables['names']
+        self.sections = tables['sections']
+        self.groups = tables['groups']
+        # (department, course number) pairs, sorted
+        self.courses = [tuple(course) for course in tables['courses']]
+
+        for name, dtype in ARRAYS:
+            setattr(self, name, arrays[name])
+
+    def __len__(self):
+        return len(self.day_bits)
+
+    def group_sizes(self):
+        return np.bincount(self.group_ids, minlength=len(self.groups))[self.group_ids]
+
+    def keys(self):
+        return [self.groups[group] for group in self.group_ids.tolist()]
+
+    def to_frame(self):
+        # the catalog as ScheduleMaker has always held it: Days as lists and times as HH:MM:SS
+        day_lists = [[day for bit, day in enumerate(DAYS) if day_bits >> bit & 1] for day_bits in range(1 << len(DAYS))]
+        times = {minutes: f"{minutes // 60:02}:{minutes % 60:02}:00" for minutes in set(self.starts.tolist()) | set(self.ends.tolist())}
+
+        return pd.DataFrame({
+            'Department': np.array(self.departments, dtype=object)[self.department_codes],
+            'Course': np.asarray(self.course_numbers, dtype=np.int64),
+            'Name': np.array(self.names, dtype=object)[self.name_codes],
+            'Section': np.array(self.sections, dtype=object)[self.section_codes],
+            'Days': [day_lists[day_bits] for day_bits in self.day_bits.tolist()],
+            'Start': [times[minutes] for minutes in self.starts.tolist()],
+            'End': [times[minutes] for minutes in self.ends.tolist()]
+        })
+
+    def save(self, path):
+        tables = {'departments': self.departments, 'names': self.names, 'sections': self.sections, 'groups': self.groups, 'courses': self.courses}
+
+        # offsets are relative to the end of the header, which is padded to the alignment too
+        arrays = dict()
+        offset = 0
+        for name, dtype in ARRAYS:
+            values = np.ascontiguousarray(getattr(self, name), dtype=dtype)
+            arrays[name] = {'offset': offset, 'length': len(values)}
+            offset += -(-values.nbytes // ALIGNMENT) * ALIGNMENT
+
+        header = json.dumps({'rows': len(self), 'tables': tables, 'arrays': arrays}).encode()
+        prefix = len(MAGIC) + 8
+        header += b' ' * (-(prefix + len(header)) % ALIGNMENT)
+
+        with open(path, 'wb') as catalog_file:
+            catalog_file.write(MAGIC)
+            catalog_file.write(np.array([FORMAT_VERSION, len(header)], dtype='<u4').tobytes())
+            catalog_file.write(header)
+            for name, dtype in ARRAYS:
+                values = np.ascontiguousarray(getattr(self, name), dtype=np.dtype(dtype).newbyteorder('<'))
+                catalog_file.write(values.tobytes())
+                catalog_file.write(b'\0' * (-values.nbytes % ALIGNMENT))
+
+def compile_catalog(schedules):
+    days = [ast.literal_eval(days) if isinstance(days, str) else days for days in schedules['Days']]
+    day_bits = np.zeros(len(schedules), dtype=np.uint8)
+    for row, row_days in enumerate(days):
+        for day in row_days:
+            day_bits[row] |= 1 << DAYS.index(day)
+
+    department_codes, departments = pd.factorize(schedules['Department'], sort=True)
+    section_codes, sections = pd.factorize(schedules['Section'], sort=True)
+    name_codes, names = pd.factorize(schedules['Name'].fillna('') if 'Name' in schedules.columns else pd.Series([''] * len(schedules)), sort=True)
+
+    courses = sorted(set(zip(schedules['Department'], schedules['Course'])))
+    positions = {course: position for position, course in enumerate(courses)}
+
+    # sections are grouped by course and first letter of the section
+    group_ids, groups = pd.factorize(schedules['Department'] + schedules['Course'].astype(str) + schedules['Section'].str[0])
+
+    tables = {
+        'departments': list(departments),
+        'names': list(names),
+        'sections': list(sections),
+        'groups': list(groups),
+        'courses': [(department, int(course)) for department, course in courses]
+    }
+    arrays = {
+        'department_codes': department_codes.astype(np.int32),
+        'course_numbers': schedules['Course'].to_numpy(dtype=np.int32),
+        'course_ids': np.array([positions[course] for course in zip(schedules['Department'], schedules['Course'])], dtype=np.int32),
+        'name_codes': name_codes.astype(np.int32),
+        'section_codes': section_codes.astype(np.int32),
+        'group_ids': group_ids.astype(np.int32),
+        'day_bits': day_bits,
+        'starts': np.array([to_minutes(start) for start in schedules['Start']], dtype=np.int16),
+        'ends': np.array([to_minutes(end) for end in schedules['End']], dtype=np.int16)
+    }
+    return CompiledCatalog(tables, arrays)
+
+def load_catalog(path):
+    # the arrays are read only views of the mapped file, so loading doesn't read them at all
+    data = np.memmap(path, dtype=np.uint8, mode='r')
+
+    if bytes(data[:len(MAGIC)]) != MAGIC:
+        raise ValueError(f"{path} is not a compiled catalog")
+    version, header_length = data[len(MAGIC):len(MAGIC) + 8].view('<u4').tolist()
+    if version != FORMAT_VERSION:
+        raise ValueError(f"{path} is compiled catalog version {version}, expected {FORMAT_VERSION}; compile it again")
+
+    start = len(MAGIC) + 8
+    header = json.loads(bytes(data[start:start + header_length]))
+    start += header_length
+
+    arrays = dict()
+    for name, dtype in ARRAYS:
+        dtype = np.dtype(dtype).newbyteorder('<')
+        offset = start + header['arrays'][name]['offset']
+        arrays[name] = data[offset:offset + header['arrays'][name]['length'] * dtype.itemsize].view(dtype)
+
+    return CompiledCatalog(header['tables'], arrays)
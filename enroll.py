@@ -1,29 +1,189 @@
+import argparse
 import datetime
+import statistics
 import time
-import pyautogui
 
-stop = False
+# clicks the enroll button at the moment enrollment opens, e.g.
+#   python enroll.py --at 07:30:00 --clicks 5 --interval 0.2
+#   python enroll.py --at 07:30:00 --dry-run
 
 # one window
-x_coord = 656
-y_coord = 989
+X_COORD = 656
+Y_COORD = 989
 # split window
-# x_coord = 1593
-# y_coord = 786
-
-while not stop:
-    curr = datetime.datetime.now()
-
-    # check if its 9:00 AM or later, add some tolerance to ensure not clicking too early
-    if curr.hour >= 7 and curr.minute >= 30 and curr.second >= 0 and curr.microsecond >= 4:
-        # click on the enroll button
-        pyautogui.click(x_coord, y_coord)
-        if curr.second > 0:
-            stop = True
-    else:
-        # wait 50 milliseconds
-        time.sleep(0.1)
-       
-# time.sleep(5)
-# # pyautogui.click(x_coord, y_coord)
-# print(pyautogui.position())
\ No newline at end of file
+# X_COORD = 1593
+# Y_COORD = 786
+
+# the trigger sleeps until this many seconds before the target, at least, then spins the rest of
+# the way on perf_counter, which sleep can't be trusted to wake up for on time
+MIN_LEAD = 0.02
+# how many times the worst sleep overshoot seen while calibrating the lead is
+LEAD_MARGIN = 4
+CALIBRATION_SLEEPS = 20
+CALIBRATION_SLEEP = 0.001
+# longest single sleep, so a clock change while waiting is noticed
+MAX_SLEEP = 60
+# a target this many seconds in the past is taken to have only just been missed and is clicked
+# at once, anything earlier is tomorrow's
+PAST_GRACE = 60
+
+class SystemClock:
+    def now(self):
+        return datetime.datetime.now()
+
+    def perf_counter(self):
+        return time.perf_counter()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+class FakeClock:
+    # simulated time starting at start that only moves when slept or read, every perf_counter
+    # read taking tick seconds the way a spin loop does
+    def __init__(self, start, tick=0.000001, oversleep=0.0):
+        self.start = start
+        self.tick = tick
+        self.oversleep = oversleep
+        self.elapsed = 0.0
+
+    def now(self):
+        return self.start + datetime.timedelta(seconds=self.elapsed)
+
+    def perf_counter(self):
+        self.elapsed += self.tick
+        return self.elapsed
+
+    def sleep(self, seconds):
+        self.elapsed += seconds + self.oversleep
+
+class PyAutoGuiClicker:
+    # imported when first used, so the trigger can be run without a display
+    def __init__(self):
+        import pyautogui
+        self.pyautogui = pyautogui
+
+    def click(self, x, y):
+        self.pyautogui.click(x, y)
+
+class FakeClicker:
+    # remembers when each click would have happened instead of clicking
+    def __init__(self, clock):
+        self.clock = clock
+        self.clicks = []
+
+    def click(self, x, y):
+        self.clicks.append((self.clock.perf_counter(), x, y))
+
+def parse_target(value, now, grace=PAST_GRACE):
+    # HH:MM, HH:MM:SS or HH:MM:SS.ffffff, the next time it comes round: today, or tomorrow when it
+    # passed more than grace seconds ago
+    for format in ['%H:%M:%S.%f', '%H:%M:%S', '%H:%M']:
+        try:
+            target = datetime.datetime.strptime(value, format).time()
+        except ValueError:
+            continue
+        target = datetime.datetime.combine(now.date(), target)
+        if (now - target).total_seconds() > grace:
+            target += datetime.timedelta(days=1)
+        return target
+    raise ValueError(f"target time {value} isn't HH:MM, HH:MM:SS or HH:MM:SS.ffffff")
+
+class EnrollTrigger:
+    # fires a burst of clicks, the first at target and the rest interval seconds apart, and
+    # measures how late each one actually went off
+    def __init__(self, target, clicker, clock=None, x=X_COORD, y=Y_COORD, clicks=1, interval=0.1, lead=None):
+        if clicks < 1:
+            raise ValueError("clicks must be at least 1")
+        if interval < 0:
+            raise ValueError("interval can't be negative")
+
+        self.target = target
+        self.clicker = clicker
+        self.clock = clock if clock is not None else SystemClock()
+        self.x = x
+        self.y = y
+        self.clicks = clicks
+        self.interval = interval
+        self.lead = lead if lead is not None else self.__calibrate()
+
+        # (seconds late, seconds the click call took) for every click fired
+        self.fired = []
+
+    def __calibrate(self):
+        # how far past what was asked sleep wakes up here, as lead enough to start spinning
+        # before the target however late the last sleep is
+        worst = 0.0
+        for _ in range(CALIBRATION_SLEEPS):
+            start = self.clock.perf_counter()
+            self.clock.sleep(CALIBRATION_SLEEP)
+            worst = max(worst, self.clock.perf_counter() - start - CALIBRATION_SLEEP)
+        return max(MIN_LEAD, LEAD_MARGIN * worst)
+
+    def __deadline(self):
+        # the target on the perf_counter clock, reading the wall clock between two perf_counter
+        # reads and taking their middle
+        before = self.clock.perf_counter()
+        now = self.clock.now()
+        after = self.clock.perf_counter()
+        return (before + after) / 2 + (self.target - now).total_seconds()
+
+    def wait(self):
+        # sleeps until lead seconds before the target, checking the wall clock again after every
+        # sleep, and returns the target as a perf_counter deadline
+        while True:
+            remaining = (self.target - self.clock.now()).total_seconds()
+            if remaining <= self.lead:
+                break
+            self.clock.sleep(min(remaining - self.lead, MAX_SLEEP))
+        return self.__deadline()
+
+    def __spin(self, deadline):
+        while True:
+            current = self.clock.perf_counter()
+            if current >= deadline:
+                return current
+
+    def fire(self):
+        deadline = self.wait()
+        if self.clock.perf_counter() > deadline:
+            print(f"{self.target} has already passed, clicking now")
+
+        self.fired = []
+        for click in range(self.clicks):
+            fired = self.__spin(deadline + click * self.interval)
+            self.clicker.click(self.x, self.y)
+            self.fired.append((fired - deadline - click * self.interval, self.clock.perf_counter() - fired))
+
+        self.report()
+        return self.fired
+
+    def report(self):
+        lateness = [late * 1000 for late, took in self.fired]
+        for click, (late, took) in enumerate(self.fired):
+            print(f"click {click}: {late * 1000:.3f} ms late, click took {took * 1000:.3f} ms")
+        print(f"{len(lateness)} clicks at {self.target.time()}, lateness mean {statistics.mean(lateness):.3f} ms, "
+              f"max {max(lateness):.3f} ms, jitter {statistics.pstdev(lateness):.3f} ms, lead {self.lead * 1000:.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Click the enroll button at the moment enrollment opens")
+    parser.add_argument('--at', default='07:30:00', help="HH:MM[:SS[.ffffff]], tomorrow once it is over a minute past")
+    parser.add_argument('--clicks', type=int, default=5)
+    parser.add_argument('--interval', type=float, default=0.2, help="seconds between clicks")
+    parser.add_argument('--x', type=int, default=X_COORD)
+    parser.add_argument('--y', type=int, default=Y_COORD)
+    parser.add_argument('--lead', type=float, help="seconds spent spinning before the target, calibrated when left out")
+    parser.add_argument('--dry-run', action='store_true', help="time the clicks without clicking")
+    args = parser.parse_args()
+
+    clock = SystemClock()
+    target = parse_target(args.at, clock.now())
+    clicker = FakeClicker(clock) if args.dry_run else PyAutoGuiClicker()
+    trigger = EnrollTrigger(target, clicker, clock, args.x, args.y, args.clicks, args.interval, args.lead)
+
+    if target.date() != clock.now().date():
+        print(f"{args.at} has passed today, waiting for tomorrow's")
+    print(f"Waiting for {target}, spinning for the last {trigger.lead * 1000:.1f} ms")
+    trigger.fire()
+
+if __name__ == '__main__':
+    main()
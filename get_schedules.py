@@ -2,9 +2,66 @@ import requests
 from bs4 import BeautifulSoup
 import pandas as pd
 import re
+import os
+import hashlib
+import pickle
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from catalog_store import CatalogStore, COLUMNS, is_store_path
+
+# responses worth asking for again after a pause
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class ResponseCache:
+    # response bodies kept on disk by url. an entry younger than ttl seconds is used as is, an older
+    # one is revalidated with its ETag / Last-Modified so an unchanged page costs only a 304
+    def __init__(self, directory='.http_cache', ttl=12 * 60 * 60):
+        self.directory = directory
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+
+    def __path(self, url):
+        return os.path.join(self.directory, hashlib.sha1(url.encode()).hexdigest() + '.pickle')
+
+    def get(self, url):
+        try:
+            with open(self.__path(url), 'rb') as entry_file:
+                return pickle.load(entry_file)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+    def fresh(self, entry):
+        return time.time() - entry['fetched'] < self.ttl
+
+    def headers(self, entry):
+        # the conditional request headers for revalidating an entry
+        headers = dict()
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def put(self, url, content, etag=None, last_modified=None):
+        entry = {'url': url, 'fetched': time.time(), 'etag': etag, 'last_modified': last_modified, 'content': content}
+
+        # written to a temporary file first so a reader never sees half an entry
+        path = self.__path(url)
+        temporary_path = f"{path}.{threading.get_ident()}"
+        with open(temporary_path, 'wb') as entry_file:
+            pickle.dump(entry, entry_file)
+        os.replace(temporary_path, path)
+
+        return entry
 
 class CourseInfoScraper:
-    def __init__(self, classes_df, schedules_df=None):
+    # workers courses are fetched at once over one pooled keep-alive session, starting at most
+    # requests_per_second requests, and failed requests are retried with exponential backoff.
+    # the site urls can be pointed elsewhere, e.g. at a local server with recorded pages.
+    # pages are cached in cache_dir for cache_ttl seconds (cache_dir=None turns the cache off)
+    def __init__(self, classes_df, schedules_df=None, workers=1, requests_per_second=None, retries=3, backoff=0.5, timeout=30,
+                 catalog_url="https://mobile.princeton.edu", course_url="https://m.princeton.edu", cache_dir='.http_cache', cache_ttl=12 * 60 * 60):
         if isinstance(classes_df, str):
             try:
                 self.classes_df = pd.read_excel('classes.xlsx')
@@ -15,14 +72,114 @@ class CourseInfoScraper:
         else:
             raise ValueError("Must pass in dataframe or filepath to excel data for classes_df")
 
+        # with a catalog store, newly scraped sections are written straight to it
+        self.store = None
         if schedules_df is None:
-            self.schedules_df = pd.DataFrame(columns=['Department', 'Course', 'Section', 'Days', 'Start', 'End'])
+            self.schedules_df = pd.DataFrame(columns=COLUMNS)
+        elif isinstance(schedules_df, CatalogStore) or is_store_path(schedules_df):
+            self.store = schedules_df if isinstance(schedules_df, CatalogStore) else CatalogStore(schedules_df)
+            self.schedules_df = self.store.load()
         elif isinstance(schedules_df, str):
             self.schedules_df = pd.read_excel('schedules.xlsx')
         elif isinstance(schedules_df, pd.DataFrame):
             self.schedules_df = schedules_df
         else:
-            raise ValueError("schedules_df is not a valid df or xlsx filepath")
+            raise ValueError("schedules_df is not a valid df, catalog store or xlsx/db filepath")
+
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        if requests_per_second is not None and requests_per_second <= 0:
+            raise ValueError("requests_per_second must be positive")
+
+        self.workers = workers
+        self.requests_per_second = requests_per_second
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.catalog_url = catalog_url.rstrip('/')
+        self.course_url = course_url.rstrip('/')
+
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.__rate_lock = threading.Lock()
+        self.__next_request = 0
+
+        self.cache = None if cache_dir is None else ResponseCache(cache_dir, cache_ttl)
+
+        # each catalog or search page is parsed once per scraper, however many courses are looked up in it
+        self.__listings = dict()
+        self.__listing_locks = dict()
+        self.__listings_lock = threading.Lock()
+
+    def __wait_turn(self):
+        # spaces request starts evenly across all threads
+        if self.requests_per_second is None:
+            return
+
+        with self.__rate_lock:
+            now = time.monotonic()
+            start = max(now, self.__next_request)
+            self.__next_request = start + 1 / self.requests_per_second
+
+        if start > now:
+            time.sleep(start - now)
+
+    def __request(self, url, headers):
+        for attempt in range(self.retries + 1):
+            self.__wait_turn()
+            try:
+                page = self.session.get(url, headers=headers, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.retries:
+                    raise
+            else:
+                if page.status_code not in RETRY_STATUSES or attempt == self.retries:
+                    return page
+
+            time.sleep(self.backoff * 2 ** attempt)
+
+    def __get(self, url):
+        # the body of the page at url, from the cache when it's still good
+        if self.cache is None:
+            return self.__request(url, dict()).content
+
+        entry = self.cache.get(url)
+        if entry is not None and self.cache.fresh(entry):
+            return entry['content']
+
+        page = self.__request(url, dict() if entry is None else self.cache.headers(entry))
+        if page.status_code == 304 and entry is not None:
+            entry = self.cache.put(url, entry['content'], page.headers.get('ETag', entry['etag']), page.headers.get('Last-Modified', entry['last_modified']))
+        elif page.status_code == 200:
+            entry = self.cache.put(url, page.content, page.headers.get('ETag'), page.headers.get('Last-Modified'))
+        else:
+            return page.content
+
+        return entry['content']
+
+    def __listing(self, url):
+        # the (title, href) of every course listed on a catalog or search page
+        with self.__listings_lock:
+            lock = self.__listing_locks.setdefault(url, threading.Lock())
+
+        with lock:
+            if url not in self.__listings:
+                listing = []
+                results = BeautifulSoup(self.__get(url), "html.parser").find_all('li', class_='kgoui_object')
+                for result in results:
+                    item_titles = result.find_all('span', class_="kgoui_list_item_title")
+
+                    if len(item_titles) <= 0:
+                        continue
+                    links = result.find_all('a')
+                    listing.append((item_titles[0].contents[0], links[0].get('href') if links else None))
+
+                self.__listings[url] = listing
+
+        return self.__listings[url]
 
     def __parse_days(self, day_string):
         days = []
@@ -48,27 +205,20 @@ class CourseInfoScraper:
         if re.match(r'[A-Z]{3}\d{3}', course):
             department = course[:3]
             course = course[3:]
-            search_URL = f"https://mobile.princeton.edu/default/courses/catalog?area={department}"
+            search_URL = f"{self.catalog_url}/default/courses/catalog?area={department}"
 
         else: 
             #replace spaces with %20, replace commas with %2C, replace slashes with %2F, and replace colons with %3A
             search = course.replace(' ', '%20').replace(',', '%2C').replace('/', '%2F').replace(':', '%3A')
-            search_URL = f"https://mobile.princeton.edu/default/courses/search?filter={search}&search=Search"
+            search_URL = f"{self.catalog_url}/default/courses/search?filter={search}&search=Search"
 
-        page = requests.get(search_URL)
-        results = BeautifulSoup(page.content, "html.parser").find_all('li', class_='kgoui_object')
         course_URL = None
 
-        for result in results:
-            item_titles = result.find_all('span', class_="kgoui_list_item_title")
-
-            if len(item_titles) <= 0:
-                continue
-            text = item_titles[0].contents[0]
+        for text, href in self.__listing(search_URL):
             if str(course) in text:
                 # look for first instance of three capital letters, space, numbers in continuous text and set to course
                 course = re.search(r'[A-Z]{3} \d{3}', text).group(0)
-                course_URL = f"https://m.princeton.edu{result.find_all('a')[0].get('href')}"
+                course_URL = f"{self.course_url}{href}"
                 # look for the first colon in the text, take everything after it, trim it, and set to topic
                 topic = text[text.find(':')+1:].strip()
                 break
@@ -77,8 +227,7 @@ class CourseInfoScraper:
             print(f'No results for {course}')
             return None
 
-        page2 = requests.get(course_URL)
-        results = BeautifulSoup(page2.content, 'html.parser').find(id='kgoui_Rcontent_I1_Rcontent_I0_Rsections')
+        results = BeautifulSoup(self.__get(course_URL), 'html.parser').find(id='kgoui_Rcontent_I1_Rcontent_I0_Rsections')
         sections = results.find_all('div', class_='kgoui_object')
 
         section_info = []
@@ -124,11 +273,13 @@ class CourseInfoScraper:
     def scrape_course_info(self):
         schedule_info = {}
 
-        existing_courses = []
+        courses = []
 
-        # get a list of each department and course concatenated from schedules_df indexwise
-        for index, row in self.schedules_df.iterrows():
-            existing_courses.append(f'{row["Department"]}{row["Course"]}')
+        # each department and course concatenated, and every name, from schedules_df (the store
+        # answers from its index instead)
+        if self.store is None:
+            existing_courses = set(self.schedules_df['Department'] + self.schedules_df['Course'].astype(str))
+            existing_courses.update(self.schedules_df['Name'])
 
         for index, row in self.classes_df.iterrows():
             course = row['Course']
@@ -140,34 +291,49 @@ class CourseInfoScraper:
 
             print(course)
 
-            if (course in existing_courses) or course in self.schedules_df['Name'].values:
+            if self.store is not None and self.store.scraped(course):
                 continue
-                    
-            result = self.__scrape_course(course)
-            if result is not None:
-                schedule_info[f'{result[0]}'] = [result[1], result[2]]
-            else:
+            if self.store is None and course in existing_courses:
                 continue
 
-        new_classes_df = pd.DataFrame(columns=['Class', 'Name', 'Section', 'Schedule'])
+            courses.append(course)
 
-        # for each key in schedule_info
+        # map keeps the wishlist order, so results come out the same however many workers fetch them
+        if self.workers == 1:
+            results = map(self.__scrape_course, courses)
+        else:
+            executor = ThreadPoolExecutor(max_workers=self.workers)
+            results = executor.map(self.__scrape_course, courses)
+
+        try:
+            for result in results:
+                if result is not None:
+                    schedule_info[f'{result[0]}'] = [result[1], result[2]]
+        finally:
+            if self.workers != 1:
+                executor.shutdown(cancel_futures=True)
+
+        # a row per section, built as a list and turned into a DataFrame once
+        rows = []
         for key in schedule_info:
-            row = [key]
-            row.append(schedule_info[key][0])
             for item in schedule_info[key][1]:
-                row.append(item['Section'])
-                row.append(item['Schedule'])
-
-                # append row to new_classes_df
-                new_classes_df.loc[len(new_classes_df)] = row
-                row = [key]
-                row.append(schedule_info[key][0])
+                rows.append([key, schedule_info[key][0], item['Section'], item['Schedule']])
+        new_classes_df = pd.DataFrame(rows, columns=['Class', 'Name', 'Section', 'Schedule'])
 
         new_classes_df = self.__format_classes_df(new_classes_df)
 
-        if new_classes_df:
+        if new_classes_df is not None:
             self.schedules_df = pd.concat([self.schedules_df, new_classes_df], ignore_index=True)
+            if self.store is not None:
+                self.store.upsert(new_classes_df)
 
     def save_schedules_df(self, filename='schedules.xlsx'):
-        self.schedules_df.to_excel(filename, index=False)
+        # a .db/.sqlite path (or a CatalogStore) is upserted into, anything else is exported as xlsx
+        if isinstance(filename, CatalogStore):
+            filename.upsert(self.schedules_df)
+        elif is_store_path(filename):
+            store = CatalogStore(filename)
+            store.upsert(self.schedules_df)
+            store.close()
+        else:
+            self.schedules_df.to_excel(filename, index=False)
@@ -0,0 +1,141 @@
+import argparse
+import concurrent.futures
+import json
+import random
+import socket
+import statistics
+import threading
+import time
+from synthetic_catalog import make_catalog
+from schedule_service import ScheduleClient, ScheduleService, make_server
+
+# sends many concurrent requests to a schedule service and reports latencies, e.g.
+#   python load_test.py --requests 200 --concurrency 16
+#   python load_test.py --url http://127.0.0.1:8765 --requests 500
+# without --url or --socket it starts a service of its own on a synthetic catalog
+
+def request_mix(departments, distinct, seed):
+    # distinct requests of every action, drawn from again and again so some of them repeat the
+    # way users asking for the same thing would
+    generator = random.Random(seed)
+    days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
+    mix = []
+    for index in range(distinct):
+        params = {'num_courses': generator.choice([2, 3])}
+        if generator.random() < 0.5:
+            params['exclude'] = generator.sample(departments, 2)
+        if generator.random() < 0.5:
+            params['day_limits'] = {generator.choice(days): generator.randint(1, 2)}
+        if generator.random() < 0.3:
+            params['time_limits'] = [('7:00 AM', generator.choice(['9:00 AM', '10:00 AM']))]
+
+        action = generator.choices(['schedules', 'best', 'count'], weights=[6, 2, 2])[0]
+        if action == 'schedules':
+            params['limit'] = generator.choice([20, 100])
+        elif action == 'best':
+            params['preferences'] = {'idle_minutes': 1, 'early_start': generator.choice([0.5, 2])}
+            params['top_k'] = 10
+            params['per_combo'] = 5
+        mix.append((action, params))
+    return mix
+
+def run(client, mix, requests, concurrency, timeout, seed):
+    generator = random.Random(seed)
+    picks = [generator.choice(mix) for request in range(requests)]
+    results = []
+    lock = threading.Lock()
+
+    def send(pick):
+        action, params = pick
+        start = time.perf_counter()
+        try:
+            if action == 'schedules':
+                answer = client.schedules(timeout=timeout, **params)
+            elif action == 'best':
+                answer = client.best(timeout=timeout, **params)
+            else:
+                answer = client.count(timeout=timeout, **params)
+            outcome = 'cached' if answer['cached'] else 'searched'
+        except TimeoutError:
+            outcome = 'timeout'
+        except (ValueError, RuntimeError, OSError):
+            outcome = 'error'
+        with lock:
+            results.append((action, outcome, time.perf_counter() - start))
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(concurrency) as executor:
+        list(executor.map(send, picks))
+    return results, time.perf_counter() - start
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def report(results, seconds):
+    latencies = [latency * 1000 for action, outcome, latency in results]
+    print(f"{len(results)} requests in {seconds:.2f}s, {len(results) / seconds:.1f} requests/s")
+    print(f"latency p50 {percentile(latencies, 0.5):.1f} ms, p95 {percentile(latencies, 0.95):.1f} ms, max {max(latencies):.1f} ms, mean {statistics.mean(latencies):.1f} ms")
+    for outcome in ['searched', 'cached', 'timeout', 'error']:
+        matching = [latency * 1000 for action, result, latency in results if result == outcome]
+        if matching:
+            print(f"  {outcome:<10} {len(matching):>6}  p50 {percentile(matching, 0.5):.1f} ms")
+    for name in ['schedules', 'best', 'count']:
+        matching = [latency * 1000 for action, result, latency in results if action == name and result == 'searched']
+        if matching:
+            print(f"  {name:<10} {len(matching):>6}  searched p50 {percentile(matching, 0.5):.1f} ms, max {max(matching):.1f} ms")
+    return {'requests': len(results), 'seconds': seconds, 'p50_ms': percentile(latencies, 0.5), 'p95_ms': percentile(latencies, 0.95),
+            'outcomes': {outcome: sum(result == outcome for action, result, latency in results) for outcome in ['searched', 'cached', 'timeout', 'error']}}
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test a schedule service with concurrent requests")
+    parser.add_argument('--url', help="a running service to test")
+    parser.add_argument('--socket', help="a running service's unix socket to test")
+    parser.add_argument('--departments', type=int, default=10, help="size of the synthetic catalog when starting a service")
+    parser.add_argument('--courses-per-department', type=int, default=6)
+    parser.add_argument('--workers', type=int, help="workers of the service started here")
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--distinct', type=int, default=40, help="how many different requests are drawn from")
+    parser.add_argument('--timeout', type=float, default=30, help="seconds each request may run")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="write the summary here as json")
+    args = parser.parse_args()
+    if args.socket is not None and not hasattr(socket, 'AF_UNIX'):
+        parser.error("--socket needs unix sockets, which this platform doesn't support")
+
+    catalog = make_catalog(args.departments, args.courses_per_department, seed=args.seed)
+    departments = sorted(catalog['Department'].unique())
+
+    service = server = None
+    if args.url is not None or args.socket is not None:
+        client = ScheduleClient(args.url or 'http://127.0.0.1:8765', args.socket)
+        # a running service has its own catalog, so the departments come from it
+        departments = client.health()['departments']
+    else:
+        start = time.perf_counter()
+        service = ScheduleService(catalog, args.workers)
+        server = make_server(service, port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        client = ScheduleClient(f"http://127.0.0.1:{server.server_address[1]}")
+        client.health()
+        print(f"Service on {len(catalog)} sections with {service.workers} workers started in {time.perf_counter() - start:.2f}s")
+
+    try:
+        mix = request_mix(departments, args.distinct, args.seed)
+        results, seconds = run(client, mix, args.requests, args.concurrency, args.timeout, args.seed)
+        summary = report(results, seconds)
+        summary['service'] = client.health()
+        print(f"service stats: {summary['service']['stats']}")
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+            service.close()
+
+    if args.output is not None:
+        with open(args.output, 'w') as output_file:
+            json.dump(summary, output_file, indent=2)
+
+if __name__ == '__main__':
+    main()
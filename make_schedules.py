@@ -1,28 +1,201 @@
 import pandas as pd
+import numpy as np
 import itertools
 import matplotlib.pyplot as plt
-from PIL import Image, ImageDraw, ImageFont
 import ast
-import seaborn as sns
+import copy
 import os
+import shutil
 import datetime
+import time
+import hashlib
+import re
+import collections
+import heapq
+import math
+import functools
+import operator
+import array
+import concurrent.futures
+from catalog_store import CatalogStore, is_store_path
+from compiled_catalog import CompiledCatalog, DAYS, compile_catalog, is_catalog_path, load_catalog
+from search_metrics import SearchMetrics
+from schedule_sinks import SINKS, read_checkpoint
+from render_schedules import ScheduleRenderer, WRITERS, schedule_hash, init_renderer, render_worker
 
 pd.options.mode.chained_assignment = None
 
+MINUTES_PER_DAY = 24 * 60
+# course combinations handed to a worker process at a time
+COMBOS_PER_TASK = 32
+# how many times fewer section choices searching only one section per meeting time has to make
+# for a combination before it is worth expanding the results back to every section
+CLASS_SEARCH_FACTOR = 4
+# catalog rows whose clashes are worked out at once
+CLASH_BLOCK_ROWS = 1024
+# seconds between progress reports while searching
+PROGRESS_INTERVAL = 5
+
+# built in preferences, each a cost of the classes on each day as sorted (start, end) minutes,
+# where lower is better
+def idle_minutes(day_times):
+    # time between classes on the same day
+    return sum(max(start - end, 0) for times in day_times.values() for (_, end), (start, _) in zip(times, times[1:]))
+
+def early_start(day_times):
+    # how early the first class of the week starts
+    return MINUTES_PER_DAY - min((times[0][0] for times in day_times.values()), default=MINUTES_PER_DAY)
+
+def late_end(day_times):
+    # how late the last class of the week ends
+    return max((end for times in day_times.values() for start, end in times), default=0)
+
+def class_days(day_times):
+    return len(day_times)
+
+def load_spread(day_times):
+    # difference between the busiest and the lightest weekday
+    counts = [len(day_times.get(day, [])) for day in DAYS[:5]]
+    return max(counts) - min(counts)
+
+SCORERS = {
+    'idle_minutes': idle_minutes,
+    'early_start': early_start,
+    'late_end': late_end,
+    'days': class_days,
+    'load_spread': load_spread
+}
+
+# preferences that can only grow as sections are added, so a partial schedule's cost is a lower
+# bound on the cost of every schedule completing it
+GROWING_SCORERS = {'early_start', 'late_end', 'days'}
+
+# each worker process keeps its own ScheduleMaker, sent once when the worker starts
+worker_maker = None
+
+def init_worker(maker):
+    global worker_maker
+    worker_maker = maker
+    # forked workers start with a copy of what the parent had measured so far
+    worker_maker.metrics.reset()
+    worker_maker.metrics.callbacks = []
+
+def search_worker(combos, per_combo, limit, cutoff):
+    # along with what the worker measured while searching them
+    return worker_maker.search_chunk(combos, per_combo, limit, cutoff), worker_maker.metrics.take()
+
+class ScheduleResults:
+    # schedules kept as the catalog row positions of their sections back to back, a DataFrame is
+    # only built when a single schedule is looked up, iterated over or drawn
+    def __init__(self, materialize):
+        self.materialize = materialize
+        self.rows = array.array('i')
+        self.offsets = array.array('q', [0])
+
+    def append(self, schedule):
+        self.rows.extend(schedule)
+        self.offsets.append(len(self.rows))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def schedule_rows(self, index):
+        return tuple(self.rows[self.offsets[index]:self.offsets[index + 1]])
+
+    def __getitem__(self, index):
+        # slices stay as row positions
+        if isinstance(index, slice):
+            results = ScheduleResults(self.materialize)
+            for position in range(len(self))[index]:
+                results.append(self.schedule_rows(position))
+            return results
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("schedule index out of range")
+
+        return self.materialize(self.schedule_rows(index))
+
+    def iter_rows(self):
+        for index in range(len(self)):
+            yield self.schedule_rows(index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+class StreamedResults:
+    # the schedules of a run streamed to disk, read back from the file every time they are looked
+    # at, so they take no memory however many there are
+    def __init__(self, materialize, read, count):
+        self.materialize = materialize
+        self.read = read
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def schedule_rows(self, index):
+        for position, schedule in enumerate(self.read()):
+            if position == index:
+                return schedule
+        raise IndexError("schedule index out of range")
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            results = ScheduleResults(self.materialize)
+            positions = range(len(self))[index]
+            for position, schedule in enumerate(self.read()):
+                if position in positions:
+                    results.append(schedule)
+            return results
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("schedule index out of range")
+
+        return self.materialize(self.schedule_rows(index))
+
+    def iter_rows(self):
+        return self.read()
+
+    def __iter__(self):
+        for schedule in self.read():
+            yield self.materialize(schedule)
+
 class ScheduleMaker:
-    def __init__(self, schedules, num_courses=6, must_haves=[], at_least=[], must_select=[], at_most=[], exclude=[], unique_deps=True, day_limits=dict(), time_limits=[]):
-        if isinstance(schedules, str):
-            self.schedules = pd.read_excel(schedules)
-        elif isinstance(schedules, pd.DataFrame):
-            self.schedules = schedules
+    def __init__(self, schedules, num_courses=6, must_haves=[], at_least=[], must_select=[], at_most=[], exclude=[], unique_deps=True, day_limits=dict(), time_limits=[], preferences=dict(), callbacks=[], unique_listings=True):
+        if isinstance(schedules, CompiledCatalog):
+            self.catalog = schedules
+        elif is_catalog_path(schedules):
+            self.catalog = load_catalog(schedules)
         else:
-            raise ValueError("schedules is not a valid df or xlsx filepath")
-
-        self.schedules['Days'] = self.schedules['Days'].apply(ast.literal_eval)
-
-        self.courses = []
-        for department, course in set(zip(self.schedules["Department"], self.schedules["Course"])):
-            self.courses.append({'Department': department, 'Course': course})
+            if isinstance(schedules, CatalogStore):
+                self.schedules = schedules.load()
+            elif is_store_path(schedules):
+                store = CatalogStore(schedules)
+                self.schedules = store.load()
+                store.close()
+            elif isinstance(schedules, str):
+                self.schedules = pd.read_excel(schedules)
+            elif isinstance(schedules, pd.DataFrame):
+                self.schedules = schedules
+            else:
+                raise ValueError("schedules is not a valid df, catalog store, compiled catalog or xlsx/db/catalog filepath")
+
+            self.schedules['Days'] = self.schedules['Days'].apply(lambda days: ast.literal_eval(days) if isinstance(days, str) else days)
+            self.catalog = compile_catalog(self.schedules)
+
+        # a compiled catalog gets its DataFrame back from the arrays
+        if not hasattr(self, 'schedules'):
+            self.schedules = self.catalog.to_frame()
+
+        # sorted so combinations, and with them results and image names, come out in the same order every run
+        self.courses = [{'Department': department, 'Course': course} for department, course in self.catalog.courses]
+
+        self.__compile_sections()
 
         self.params = {
             'num_courses': num_courses,
@@ -31,318 +204,1433 @@ class ScheduleMaker:
             'must_select': must_select,
             'at_most': at_most,
             'exclude': exclude,
+            # take at most one course from each department
             'uniqueDeps': unique_deps,
+            # take at most one listing of a cross listed course, which is any set of courses with
+            # the same Name whose sections meet on the same days at the same times. courses that
+            # only share a generic name, like two different "Junior Seminar"s, aren't listings
+            'uniqueListings': unique_listings,
             'day_limits': day_limits,
-            'time_limits': time_limits
+            'time_limits': time_limits,
+            'preferences': preferences
         }
 
         self.results = None
+        self.scores = None
+        self.__graph = None
+
+        # set while ranking: how many schedules to keep, the best so far and whether partial
+        # schedules can be pruned against them
+        self.__top_k = None
+        self.__best = []
+        self.__order = 0
+        self.__cutoff_floor = None
+        self.__pruning = False
+        # whether schedules of interchangeable sections are expanded to every section or kept as
+        # one schedule of the first section of each class
+        self.__expand_classes = True
+        # whether sections are searched fewest possible first (MRV). a combination's schedules
+        # then have to be collected and sorted back into order before any is handed on, so it is
+        # only done when every schedule is kept in memory anyway
+        self.__mrv = False
+
+        # the last complete generate_schedules run, which later runs with tighter parameters
+        # filter instead of searching again
+        self.__solved = None
+
+        # phase times, counters and hit rates of the last search, see search_metrics
+        self.metrics = SearchMetrics()
+        for callback in callbacks:
+            self.metrics.add_callback(callback)
+
+    def __getstate__(self):
+        # worker processes only need the catalog and parameters, not earlier results, and measure
+        # into their own metrics without the callbacks
+        state = self.__dict__.copy()
+        state['results'] = None
+        state['scores'] = None
+        state['_ScheduleMaker__solved'] = None
+        state['_ScheduleMaker__clashes'] = dict()
+        state['metrics'] = SearchMetrics()
+        state['metrics'].detailed = self.metrics.detailed
+        return state
 
     def update_param(self, param, value):
         self.params[param] = value
 
-    def __overlap(self, row, new_times):
-        if (any([day in row['Days'] for day in new_times['Days']]) and (row['End'] >= new_times['Start']) and (row['Start'] <= new_times['End'])):
-            return True
-        return False
-
-    def __addable(self, existing_times, new_times):
-        # check time limits
-        time_limits = self.params['time_limits'].copy()
-        for index, time_limit in enumerate(time_limits):
-            start = datetime.datetime.strptime(time_limit[0], '%I:%M %p')
-            end = datetime.datetime.strptime(time_limit[1], '%I:%M %p')
-            time_limits[index] = (start, end)
-
-        start = datetime.datetime.strptime(new_times['Start'], '%H:%M:%S')
-        end = datetime.datetime.strptime(new_times['End'], '%H:%M:%S')
-
-        if any([(start < time_limit[1] and end > time_limit[0]) for time_limit in time_limits]):
-            return False
-
-        # check overlaps
-        for row in existing_times:
-            if self.__overlap(row, new_times):
-                return False
-
-        return True
+    def __to_minutes(self, value, format):
+        if isinstance(value, str):
+            value = datetime.datetime.strptime(value, format)
+        return value.hour * 60 + value.minute
+
+    def __compile_sections(self):
+        # everything below is indexed by row position in self.schedules
+        self.__course_ids = np.asarray(self.catalog.course_ids, dtype=np.int64)
+        self.__course_rows = [[] for course in self.courses]
+        for row, course in enumerate(self.__course_ids.tolist()):
+            self.__course_rows[course].append(row)
+
+        # sections are grouped by course and first letter of the section (lecture, precept, ...)
+        self.__keys = self.catalog.keys()
+        self.__course_names = [''] * len(self.courses)
+        for course, name in zip(self.__course_ids.tolist(), self.catalog.name_codes.tolist()):
+            self.__course_names[course] = self.__course_names[course] or self.catalog.names[name]
+        # every (days, start, end) each course's sections meet at, which all listings of a cross
+        # listed course share
+        meetings = [set() for course in self.courses]
+        for course, meeting in zip(self.__course_ids.tolist(), zip(self.catalog.day_bits.tolist(), self.catalog.starts.tolist(), self.catalog.ends.tolist())):
+            meetings[course].add(meeting)
+        self.__course_meetings = [tuple(sorted(meeting)) for meeting in meetings]
+        self.__group_sizes = self.catalog.group_sizes().tolist()
+        day_lists = [[day for bit, day in enumerate(DAYS) if day_bits >> bit & 1] for day_bits in range(1 << len(DAYS))]
+        self.__days = [day_lists[day_bits] for day_bits in self.catalog.day_bits.tolist()]
+
+        # time limits ignore the day, so each section becomes a one day mask with a bit per minute
+        # from start up to (not including) end, which intersects a limit exactly when start < limit
+        # end and end > limit start
+        self.__spans = []
+        # meeting days and times as arrays, for checking many pairs of sections at once
+        self.__day_bits = np.asarray(self.catalog.day_bits, dtype=np.uint8)
+        self.__starts = np.asarray(self.catalog.starts, dtype=np.int16)
+        self.__ends = np.asarray(self.catalog.ends, dtype=np.int16)
+
+        # most sections share a handful of meeting times, so each one's mask is built once
+        masks = dict()
+        for times in zip(self.__starts.tolist(), self.__ends.tolist()):
+            if times not in masks:
+                start, end = times
+                masks[times] = ((1 << max(end - start, 0)) - 1) << start
+            self.__spans.append(masks[times])
+
+        self.__times = list(zip(self.__starts.tolist(), self.__ends.tolist()))
+
+        # for the section search, the rows each row clashes with as a bitset of rows, only worked
+        # out for the rows of the combinations searched as they come up, and the rows meeting on
+        # each day
+        self.__clashes = dict()
+        self.__row_days = self.__day_bits.tolist()
+        self.__day_rows = [int.from_bytes(np.packbits((self.__day_bits >> bit) & 1, bitorder='little').tobytes(), 'little') for bit in range(len(DAYS))]
+        # the rows inside the time limits of each group searched, for the last time limits used,
+        # and the classes of each group
+        self.__group_domains = dict()
+        self.__group_classes = dict()
+
+        # sections of the same group that meet at the same times are interchangeable, each row's
+        # class is its group and meeting pattern
+        self.__patterns_of = list(zip(self.__keys, self.__day_bits.tolist(), self.__starts.tolist(), self.__ends.tolist()))
+        self.__class_members = dict()
+        for row, pattern in enumerate(self.__patterns_of):
+            self.__class_members.setdefault(pattern, []).append(row)
+        self.__section_names = [self.catalog.sections[code] for code in self.catalog.section_codes.tolist()]
+
+    def __compile_time_limits(self):
+        forbidden = 0
+        for time_limit in self.params['time_limits']:
+            start = self.__to_minutes(time_limit[0], '%I:%M %p')
+            end = self.__to_minutes(time_limit[1], '%I:%M %p')
+            if end > start:
+                forbidden |= ((1 << (end - start)) - 1) << start
+        return forbidden
+
+    def __build_graph(self):
+        group_ids = np.asarray(self.catalog.group_ids, dtype=np.int64)
+        group_courses = np.zeros(len(self.catalog.groups), dtype=np.int64)
+        group_courses[group_ids] = self.__course_ids
+        allowed = np.array([not (span & self.__forbidden) for span in self.__spans], dtype=bool)
+
+        # sections of a group that meet at the same times fit the same sections, so only one of each
+        # inside the time limits is compared, sorted by course and then group
+        patterns = np.stack([group_courses[group_ids], group_ids, self.__day_bits, self.__starts, self.__ends], axis=1)
+        patterns = np.unique(patterns[allowed], axis=0)
+        groups = patterns[:, 1]
+        days = patterns[:, 2].astype(np.uint8)
+        starts, ends = patterns[:, 3].astype(np.int16), patterns[:, 4].astype(np.int16)
+
+        # where each group's patterns start, and where each course's groups start among the groups
+        group_starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+        bounds = np.r_[group_starts, len(patterns)]
+        courses = patterns[group_starts, 0]
+        course_starts = np.flatnonzero(np.r_[True, courses[1:] != courses[:-1]])
+
+        # courses are compatible when every group of one fits every group of the other, and usable
+        # when all of their own groups fit each other. a group with no section inside the time
+        # limits fits nothing, so its course is compatible with nothing
+        bad = np.zeros((len(self.courses), len(self.courses)), dtype=bool)
+        dead = np.unique(group_courses[np.setdiff1d(np.arange(len(group_courses)), groups)])
+        bad[dead, :] = True
+        bad[:, dead] = True
+
+        # two groups fit when some pair of their sections doesn't share a day with overlapping
+        # times, and a group fits itself when it has any section inside the time limits. worked
+        # out for a block of whole groups at a time, reduced to groups and then courses with
+        # boolean ors so no sections by sections matrix is ever held
+        first = 0
+        while first < len(group_starts):
+            last = max(first + 1, np.searchsorted(bounds, bounds[first] + CLASH_BLOCK_ROWS, side='right') - 1)
+            block = slice(bounds[first], bounds[last])
+            fits = ~(((days[block, None] & days[None, :]) != 0) & (starts[block, None] <= ends[None, :]) & (ends[block, None] >= starts[None, :]))
+            fits = np.logical_or.reduceat(np.logical_or.reduceat(fits, group_starts, axis=1), bounds[first:last] - bounds[first], axis=0)
+            fits[np.arange(last - first), np.arange(first, last)] = True
+
+            unfit = np.logical_or.reduceat(~fits, course_starts, axis=1)
+            block_courses = courses[first:last]
+            block_starts = np.flatnonzero(np.r_[True, block_courses[1:] != block_courses[:-1]])
+            bad[np.ix_(block_courses[block_starts], courses[course_starts])] |= np.logical_or.reduceat(unfit, block_starts, axis=0)
+            first = last
+        compatible = ~bad
+
+        usable = int.from_bytes(np.packbits(np.diagonal(compatible), bitorder='little').tobytes(), 'little')
+        packed = np.packbits(compatible, axis=1, bitorder='little')
+        adjacency = [int.from_bytes(bits, 'little') & ~(1 << position) for position, bits in enumerate(map(bytes, packed))]
+
+        pairs = (compatible.sum() - np.trace(compatible)) // 2
+        print(f"{pairs} of {len(self.courses) * (len(self.courses) - 1) // 2} course pairs can be taken together")
+
+        self.__graph = {'Forbidden': self.__forbidden, 'Usable': usable, 'Adjacency': adjacency}
+
+    def __blocked(self, rules, counts, candidates, slots):
+        # why no combination can be finished from here, or None if one still might be
+
+        # not enough candidates left to fill the combination
+        remaining = candidates.bit_count()
+        if slots > remaining:
+            return 'not enough courses'
+
+        # each rule needs some number of its members among the courses still to pick, bounded
+        # by what it still requires or allows, how many members are left, and how many non
+        # members are left to fill the other slots
+        for rule, count in zip(rules, counts):
+            left = (candidates & rule['Members']).bit_count()
+            if max(rule['Lowest'] - count, slots - (remaining - left), 0) > min(rule['Highest'] - count, left, slots):
+                return rule['Reason']
+
+        return None
+
+    def __choices(self, rules, counts, candidates, slots):
+        for rule, count in zip(rules, counts):
+            # every remaining slot has to go to this rule's members, so only they are worth trying
+            if rule['Lowest'] - count >= slots:
+                return candidates & rule['Members']
+        return candidates
+
+    def __search_combos(self, rules, combo, counts, candidates):
+        slots = self.params['num_courses'] - len(combo)
+
+        if slots == 0:
+            yield tuple(combo)
+            return
+
+        choices = self.__choices(rules, counts, candidates, slots)
+
+        # candidates are the courses after the last one picked that are compatible with all of
+        # them, so each combination is a clique of the compatibility graph found exactly once
+        adjacency = self.__graph['Adjacency']
+        while choices:
+            position = (choices & -choices).bit_length() - 1
+            choices &= choices - 1
+            later = candidates >> (position + 1) << (position + 1)
+
+            for rule_index, rule in enumerate(rules):
+                counts[rule_index] += (rule['Members'] >> position) & 1
+
+            # only descend into branches that can still satisfy every rule
+            self.metrics.counters['combination nodes'] += 1
+            blocked = self.__blocked(rules, counts, later & adjacency[position], slots - 1)
+            if blocked is None:
+                combo.append(position)
+                yield from self.__search_combos(rules, combo, counts, later & adjacency[position])
+                combo.pop()
+            else:
+                self.metrics.counters[f"combinations pruned: {blocked}"] += 1
+
+            for rule_index, rule in enumerate(rules):
+                counts[rule_index] -= (rule['Members'] >> position) & 1
+
+    def __count_rule(self, names, courses, lowest, highest, reason):
+        members = sum(1 << position for position, name in enumerate(names) if any(e in name for e in courses))
+        return {'Reason': reason, 'Members': members, 'Lowest': lowest, 'Highest': highest}
+
+    def __compile_rules(self):
+        # the courses that can be picked as a bitset of positions in self.courses, the count rules
+        # every combination has to satisfy, and how many courses each restriction took out
+        num_courses = self.params['num_courses']
+        names = [course['Department'] + str(course['Course']) for course in self.courses]
+
+        # the graph only depends on the catalog and the time limits
+        if self.__graph is None or self.__graph['Forbidden'] != self.__forbidden:
+            with self.metrics.phase('compatibility graph'):
+                self.__build_graph()
+            self.metrics.counters['graph built'] += 1
+        else:
+            self.metrics.counters['graph reused'] += 1
 
-    def __generate_combos(self):
-        courses = self.courses.copy()
+        # courses that can be taken at all
+        candidates = self.__graph['Usable']
+        removed = [('time_limits and clashing sections', len(self.courses) - candidates.bit_count())]
 
         # don't have these
         for excluded in self.params['exclude']:
-            courses = [course for course in courses if not (course['Department'] == excluded or course['Department'] + str(course['Course']) == excluded)]
-
-        combos = list(itertools.combinations(courses, self.params['num_courses']))
+            before = candidates
+            for position, course in enumerate(self.courses):
+                if course['Department'] == excluded or names[position] == excluded:
+                    candidates &= ~(1 << position)
+            removed.append((f"exclude {excluded}", (before & ~candidates).bit_count()))
 
-        print(f"Generated {len(combos)} combinations")
+        # every count rule becomes which courses it counts and the lowest and highest allowed count
+        rules = []
 
         # have all of these
         for must_have in self.params['must_haves']:
-            combos = [combo for combo in combos if any((must_have in (course['Department'] + str(course['Course']))) for course in combo)]
-
-        print(f"Filtered to {len(combos)} combinations with all must haves")
+            rules.append(self.__count_rule(names, [must_have], 1, num_courses, f"must_haves {must_have}"))
 
         # have at least some number of these
         for least in self.params['at_least']:
-            combos = [combo for combo in combos if sum(any(e in (course['Department'] + str(course['Course'])) for e in least['Courses']) for course in combo) >= least['Number']]
-
-        print(f"Filtered to {len(combos)} combinations with at least all at leasts")
+            rules.append(self.__count_rule(names, least['Courses'], least['Number'], num_courses, f"at_least {least['Number']} of {least['Courses']}"))
 
         # have at most some number of these
         for most in self.params['at_most']:
-            combos = [combo for combo in combos if sum(any(e in (course['Department'] + str(course['Course'])) for e in most['Courses']) for course in combo) <= most['Number']]
-
-        print(f"Filtered to {len(combos)} combinations with at most all at mosts")
+            rules.append(self.__count_rule(names, most['Courses'], 0, most['Number'], f"at_most {most['Number']} of {most['Courses']}"))
 
         # have some number of these
         for select in self.params['must_select']:
-            combos = [combo for combo in combos if sum(any(e in (course['Department'] + str(course['Course'])) for e in select['Courses']) for course in combo) == select['Number']]
-
-        print(f"Filtered to {len(combos)} combinations with all must selects")
-
-        return combos
-
-    def __exceed_days(self, schedule):
-        counter = dict()
-        for class_ in schedule:
-            for day in class_['Days']:
-                counter[day] = counter.get(day, 0) + 1
-
-        for limited_day in self.params['day_limits'].keys():
-            if limited_day in counter.keys() and counter[limited_day] > self.params['day_limits'][limited_day]:
-                return True
-
-        return False
-
-    def __find_combination(self, schedule, keys, current_schedule):
-        key = keys[0]
-
-        # get rows of schedule where Key is key as a df called key_df
-        key_df = schedule[schedule['Key'] == key]
-
-        # iterate through rows of key_df
-        for index, row in key_df.iterrows():
-            # check if row overlaps with any rows in current_schedule
-            if self.__addable(current_schedule, row):
-                # if not, add row to current_schedule
-                new_schedule = current_schedule.copy()
-                new_schedule.append(row)
-                # if keys is empty, return current_schedule
-                if len(keys) == 1:
-                    # check day limit
-                    if not self.__exceed_days(new_schedule):
-                        self.results.append(pd.concat(new_schedule, axis=1).T.reset_index(drop=True))
-                        return True
-                    continue
-                # else, call find_combination with keys[1:], current_schedule
-                else:
-                    if self.__find_combination(schedule, keys[1:], new_schedule):
-                        return True
-        return False
+            rules.append(self.__count_rule(names, select['Courses'], select['Number'], select['Number'], f"must_select {select['Number']} of {select['Courses']}"))
+
+        # one course per department
+        if self.params['uniqueDeps']:
+            departments = dict()
+            for position, course in enumerate(self.courses):
+                departments.setdefault(course['Department'], []).append(position)
+            for department, positions in departments.items():
+                if len(positions) > 1:
+                    rules.append({'Reason': f"uniqueDeps {department}", 'Members': sum(1 << position for position in positions), 'Lowest': 0, 'Highest': 1})
+
+        # a cross listed course shows up once per department with the same name and the same
+        # meetings, and only one of its listings can be taken
+        if self.params['uniqueListings']:
+            listings = dict()
+            for position, (name, meetings) in enumerate(zip(self.__course_names, self.__course_meetings)):
+                if name:
+                    listings.setdefault((name, meetings), []).append(position)
+            for (name, meetings), positions in listings.items():
+                if len(positions) > 1:
+                    rules.append({'Reason': f"uniqueListings {name}", 'Members': sum(1 << position for position in positions), 'Lowest': 0, 'Highest': 1})
+
+        return candidates, rules, removed
+
+    def __check_batch(self, rules, combos):
+        # which rules each combination satisfies, as a (rules, combinations) array, counting every
+        # rule's members in every combination at once
+        membership = np.array([[(rule['Members'] >> position) & 1 for position in range(len(self.courses))] for rule in rules], dtype=np.int16).reshape(len(rules), len(self.courses))
+        lowest = np.array([rule['Lowest'] for rule in rules], dtype=np.int16)[:, None]
+        highest = np.array([rule['Highest'] for rule in rules], dtype=np.int16)[:, None]
+
+        counts = membership[:, combos].sum(axis=2)
+        return (counts >= lowest) & (counts <= highest)
+
+    def check_combos(self, combos):
+        # whether each combination of course positions in self.courses keeps to exclude and every
+        # count rule, for a whole batch at once
+        self.__forbidden = self.__compile_time_limits()
+        candidates, rules, removed = self.__compile_rules()
+
+        combos = np.asarray(combos, dtype=np.int64).reshape(-1, self.params['num_courses'])
+        usable = np.array([(candidates >> position) & 1 for position in range(len(self.courses))], dtype=bool)
+        return usable[combos].all(axis=1) & self.__check_batch(rules, combos).all(axis=0)
+
+    def explain_constraints(self, batch_size=8192):
+        # how many courses each restriction takes out, then how many of the combinations of the
+        # remaining courses that can be taken together each count rule rejects, and how many
+        # are rejected by that rule alone
+        self.__forbidden = self.__compile_time_limits()
+        candidates, rules, removed = self.__compile_rules()
+
+        rejected = np.zeros(len(rules), dtype=np.int64)
+        only = np.zeros(len(rules), dtype=np.int64)
+        total = 0
+        kept = 0
+
+        combos = self.__search_combos([], [], [], candidates)
+        for batch in iter(lambda: list(itertools.islice(combos, batch_size)), []):
+            satisfied = self.__check_batch(rules, np.array(batch, dtype=np.int64))
+            failed = ~satisfied
+            rejected += failed.sum(axis=1)
+            only += (failed & (failed.sum(axis=0) == 1)).sum(axis=1)
+            kept += satisfied.all(axis=0).sum()
+            total += len(batch)
+
+        report = [{'Rule': reason, 'Applies To': 'courses', 'Checked': len(self.courses), 'Removed': count, 'Removed Alone': count} for reason, count in removed]
+        report += [{'Rule': rule['Reason'], 'Applies To': 'combinations', 'Checked': total, 'Removed': int(rejected[index]), 'Removed Alone': int(only[index])} for index, rule in enumerate(rules)]
+
+        print(f"{kept} of {total} combinations of compatible courses keep to every rule")
+        return pd.DataFrame(report, columns=['Rule', 'Applies To', 'Checked', 'Removed', 'Removed Alone'])
+
+    def __generate_combos(self):
+        num_courses = self.params['num_courses']
+        with self.metrics.phase('constraints'):
+            candidates, rules, removed = self.__compile_rules()
+        for reason, count in removed:
+            self.metrics.counters[f"courses removed: {reason}"] += count
+
+        # depth first in the same order as itertools.combinations, dropping a branch as soon as
+        # it can no longer satisfy every rule, so only the current path is ever held in memory
+        counts = [0] * len(rules)
+        blocked = self.__blocked(rules, counts, candidates, num_courses)
+        if blocked is not None:
+            self.metrics.counters[f"combinations pruned: {blocked}"] += 1
+            return iter(())
+        return self.__search_combos(rules, [], counts, candidates)
+
+    def __day_times(self, schedule):
+        day_times = dict()
+        for row in schedule:
+            for day in self.__days[row]:
+                day_times.setdefault(day, []).append(self.__times[row])
+
+        for times in day_times.values():
+            times.sort()
+
+        return day_times
+
+    def __score(self, schedule):
+        day_times = self.__day_times(schedule)
+        result = None
+
+        score = 0
+        for scorer, weight in self.params['preferences'].items():
+            # custom scorers get the schedule as a DataFrame, like the ones in self.results
+            if callable(scorer):
+                if result is None:
+                    result = self.__materialize(schedule)
+                score += weight * scorer(result)
+            else:
+                score += weight * SCORERS[scorer](day_times)
+
+        return score
+
+    def __beaten(self, schedule):
+        if not self.__pruning:
+            return False
+        cutoff = self.__cutoff()
+        if cutoff is None:
+            return False
 
-    def generate_schedules(self):
-        self.results = []
+        day_times = self.__day_times(schedule)
+        bound = sum(weight * SCORERS[scorer](day_times) for scorer, weight in self.params['preferences'].items() if scorer in GROWING_SCORERS)
+        return bound >= cutoff
+
+    def __cutoff(self):
+        # score a schedule has to beat to be kept, if there is one yet
+        cutoff = self.__cutoff_floor
+        if self.__top_k is not None and len(self.__best) >= self.__top_k:
+            cutoff = -self.__best[0][0] if cutoff is None else min(cutoff, -self.__best[0][0])
+        return cutoff
+
+    def __offer(self, schedule, score=None):
+        if score is None:
+            score = self.__score(schedule)
+
+        # max heap of the best schedules on (score, order), so among equal scores the one found
+        # first is kept, as it would be in the unranked output
+        entry = (-score, -self.__order, schedule)
+        self.__order += 1
+
+        self.metrics.counters['ranked offered'] += 1
+        if len(self.__best) < self.__top_k:
+            heapq.heappush(self.__best, entry)
+            self.metrics.counters['ranked kept'] += 1
+        elif entry > self.__best[0]:
+            heapq.heapreplace(self.__best, entry)
+            self.metrics.counters['ranked kept'] += 1
+
+    def __ranked(self):
+        return [(-score, schedule) for score, order, schedule in sorted(self.__best, reverse=True)]
+
+    def __clash_rows(self, groups):
+        # the clashes of the groups' rows that haven't been needed before, a block of rows at a time
+        missing = [row for group in groups for row in group if row not in self.__clashes]
+        days, starts, ends = self.__day_bits, self.__starts, self.__ends
+        for start in range(0, len(missing), CLASH_BLOCK_ROWS):
+            block = np.array(missing[start:start + CLASH_BLOCK_ROWS], dtype=np.int64)
+            clashes = ((days[block, None] & days[None, :]) != 0) & (starts[block, None] <= ends[None, :]) & (ends[block, None] >= starts[None, :])
+            packed = np.packbits(clashes, axis=1, bitorder='little')
+            self.__clashes.update(zip(block.tolist(), (int.from_bytes(bits, 'little') for bits in map(bytes, packed))))
+
+    def __domains(self, groups, mrv):
+        # each group's sections still possible as a bitset of catalog rows, starting with the ones
+        # inside the time limits and, for a day limit of zero, not meeting on that day
+        self.__clash_rows(groups)
+        if self.__group_domains.get('Forbidden') != self.__forbidden:
+            self.__group_domains = {'Forbidden': self.__forbidden}
+        day_limits = [(DAYS.index(day), day_limit) for day, day_limit in self.params['day_limits'].items() if day in DAYS]
+
+        domains = []
+        for group in groups:
+            if group not in self.__group_domains:
+                domain = sum(1 << row for row in group if not self.__spans[row] & self.__forbidden)
+                self.__group_domains[group] = (domain, len(group) - domain.bit_count())
+            domain, removed = self.__group_domains[group]
+            self.metrics.counters['pruned: time limit'] += removed
+            for bit, day_limit in day_limits:
+                if day_limit <= 0:
+                    domain &= ~self.__day_rows[bit]
+            domains.append(domain)
+
+        return {'Groups': groups, 'Day Limits': day_limits, 'MRV': mrv}, domains
+
+    def __propagate(self, search, domains, group, row, counts):
+        # the domains after placing a group's section, with every section that now clashes with
+        # it or would put too many sections on a limited day taken out, or None once some group
+        # has nothing left
+        clashes = self.__clashes[row]
+
+        full = 0
+        new_counts = counts
+        if counts:
+            start = time.perf_counter() if self.metrics.detailed else None
+            day_bits = self.__row_days[row]
+            new_counts = list(counts)
+            for position, (bit, day_limit) in enumerate(search['Day Limits']):
+                if day_bits >> bit & 1:
+                    new_counts[position] += 1
+                    if new_counts[position] >= day_limit:
+                        full |= self.__day_rows[bit]
+            if start is not None:
+                self.metrics.timings['day limit check'] += time.perf_counter() - start
+
+        # the sections of the other groups taken out, counted by what took them out. one that
+        # both clashes and meets on a full day counts as an overlap
+        overlaps = day_limited = 0
+        new_domains = []
+        for index, domain in enumerate(domains):
+            if domain is None or index == group:
+                new_domains.append(None)
+                continue
+            kept = domain & ~clashes
+            overlaps += domain.bit_count() - kept.bit_count()
+            if full:
+                fitting = kept & ~full
+                day_limited += kept.bit_count() - fitting.bit_count()
+                kept = fitting
+            new_domains.append(kept)
+        self.metrics.counters['pruned: overlap'] += overlaps
+        self.metrics.counters['pruned: day limit'] += day_limited
+
+        if 0 in new_domains:
+            return None, None
+        return new_domains, new_counts
+
+    def __find_combinations(self, search, domains, assignment, current_schedule, counts):
+        # places one section of a group at a time, always one still possible alongside everything
+        # placed so far, and drops a branch as soon as some group has no section left. groups go
+        # in their order, or fewest possible sections first with MRV
+        counters = self.metrics.counters
+        counters['section search calls'] += 1
+
+        # groups are placed in order without MRV, so the next one is the number placed so far
+        depth = len(current_schedule)
+        last = depth == len(domains) - 1
+        if search['MRV']:
+            group = min((group for group, domain in enumerate(domains) if domain is not None), key=lambda group: domains[group].bit_count())
+        else:
+            group = depth
 
-        self.schedules['Key'] = self.schedules['Department'] + self.schedules['Course'].astype(str)
+        tried = 0
+        try:
+            domain = domains[group]
+            for row in search['Groups'][group]:
+                if not domain >> row & 1:
+                    continue
+                tried += 1
 
-        combos = self.__generate_combos()
+                new_schedule = current_schedule + (row,)
+                # while ranking, nothing built on this can beat the schedules already kept
+                if self.__beaten(new_schedule):
+                    counters['pruned: ranking bound'] += 1
+                    continue
 
-        print("Filtering time and date restrictions...")
+                assignment[group] = row
+                if last:
+                    counters['schedules found'] += 1
+                    yield tuple(assignment)
+                    continue
 
-        num_combos = len(combos)
+                if self.metrics.detailed:
+                    # timing every step costs about as much as the step, so it's only done when asked for
+                    start = time.perf_counter()
+                    new_domains, new_counts = self.__propagate(search, domains, group, row, counts)
+                    self.metrics.timings['propagation'] += time.perf_counter() - start
+                else:
+                    new_domains, new_counts = self.__propagate(search, domains, group, row, counts)
 
+                if new_domains is None:
+                    counters['pruned: forward check'] += 1
+                else:
+                    yield from self.__find_combinations(search, new_domains, assignment, new_schedule, new_counts)
+            assignment[group] = None
+        finally:
+            # also runs when the caller stops early
+            counters['sections tried'] += tried
+
+    def __search_sections(self, groups, mrv):
+        # every schedule of one section per group, in the order of the groups and their sections
+        search, domains = self.__domains(groups, mrv)
+        if 0 in domains:
+            return
+        schedules = self.__find_combinations(search, domains, [None] * len(groups), (), [0] * len(search['Day Limits']))
+        if mrv:
+            # MRV finds them in another order, so a combination's schedules are put back in order
+            order = {row: index for group in groups for index, row in enumerate(group)}
+            schedules = sorted(schedules, key=lambda schedule: [order[row] for row in schedule])
+        yield from schedules
+
+    def __combo_groups(self, combo):
+        rows = sorted(itertools.chain.from_iterable(self.__course_rows[course] for course in combo))
+
+        # rows of each key, fewest sections first, in the order sort_values(by=['Count']) used to
+        # leave the catalog rows in
+        groups = dict()
+        for position in np.argsort([self.__group_sizes[row] for row in rows], kind='quicksort'):
+            groups.setdefault(self.__keys[rows[position]], []).append(rows[position])
+        return [tuple(group) for group in groups.values()]
+
+    def __group_class(self, group):
+        # sections of a group that meet at the same times can always stand in for each other, so
+        # only the first of each such class is searched. the representatives of the group, the
+        # members of each representative's class in search order and each member's representative
+        if group not in self.__group_classes:
+            classes = dict()
+            for row in group:
+                classes.setdefault(self.__patterns_of[row], []).append(row)
+            members = {rows[0]: rows for rows in classes.values()}
+            representative_of = {row: rows[0] for rows in classes.values() for row in rows}
+            self.__group_classes[group] = (tuple(members), members, representative_of)
+        return self.__group_classes[group]
+
+    def __expand(self, schedules, groups, members, representative_of, level=0):
+        # schedules of representatives, from level on, back to schedules of every section, in the
+        # order searching every section would have found them: each section of the group in turn
+        # followed by every completion of its representative. the representatives come in order,
+        # so the completions of each are the next run of schedules, kept for replaying only when
+        # a later member of its class will need them
+        runs = itertools.groupby(schedules, key=lambda schedule: schedule[0])
+        run = next(runs, None)
+        replays = dict()
+
+        if level == len(groups) - 1:
+            # every member of a class whose representative completes a schedule does too
+            for row in groups[level]:
+                if row in members:
+                    if run is not None and run[0] == row:
+                        replays[row] = True
+                        run = next(runs, None)
+                        yield (row,)
+                elif representative_of[row] in replays:
+                    yield (row,)
+            return
+
+        for row in groups[level]:
+            completions = None
+            if row in members:
+                if run is not None and run[0] == row:
+                    completions = (schedule[1:] for schedule in run[1])
+                    if len(members[row]) > 1:
+                        # kept as they are first used, so stopping early doesn't search them all
+                        completions, *replays[row] = itertools.tee(completions, len(members[row]))
+            elif replays.get(representative_of[row]):
+                completions = replays[representative_of[row]].pop(0)
+
+            if completions is not None:
+                for tail in self.__expand(completions, groups, members, representative_of, level + 1):
+                    yield (row,) + tail
+
+            if row in members and run is not None and run[0] == row:
+                run = next(runs, None)
+
+    def __iter_combo(self, combo, per_combo):
+        self.metrics.counters['combinations searched'] += 1
+        groups = self.__combo_groups(combo)
+        classes = [self.__group_class(group) for group in groups]
+        representatives = [representatives for representatives, members, representative_of in classes]
+
+        if not self.__expand_classes:
+            schedules = self.__search_sections(representatives, self.__mrv)
+        elif math.prod(len(group) for group in groups) >= CLASS_SEARCH_FACTOR * math.prod(len(group) for group in representatives):
+            members, representative_of = dict(), dict()
+            for group_representatives, group_members, group_representative_of in classes:
+                members.update(group_members)
+                representative_of.update(group_representative_of)
+            schedules = self.__expand(self.__search_sections(representatives, self.__mrv), groups, members, representative_of)
+        else:
+            schedules = self.__search_sections(groups, self.__mrv)
+        if per_combo is not None:
+            schedules = itertools.islice(schedules, per_combo)
+
+        found = False
+        for schedule in self.metrics.timed_iter('section search', schedules):
+            if not found:
+                self.metrics.counters['combinations with schedules'] += 1
+                found = True
+            yield schedule
+
+    def find_schedules(self, combo, per_combo=None):
+        # every feasible schedule for one combination of course positions in self.courses,
+        # each as a tuple of row positions in self.schedules
+        self.__forbidden = self.__compile_time_limits()
+        return list(self.__iter_combo(combo, per_combo))
+
+    def search_chunk(self, combos, per_combo=None, limit=None, cutoff=None):
+        # run by worker processes: the schedules of some combinations of course positions in
+        # self.courses as (score, rows) pairs, keeping only the best of them when ranking
+        self.__best = []
+        self.__order = 0
+        self.__cutoff_floor = cutoff
+
+        schedules = []
         for combo in combos:
-            courses = pd.DataFrame(list(combo))
-            courses["Key"] = courses['Department'] + courses['Course'].astype(str)
+            for schedule in self.__iter_combo(combo, per_combo):
+                if self.__top_k is None:
+                    schedules.append((None, schedule))
+                else:
+                    self.__offer(schedule)
+            if limit is not None and len(schedules) >= limit:
+                break
+
+        if self.__top_k is not None:
+            schedules = self.__ranked()
+        return schedules
+
+    def __materialize(self, schedule):
+        result = self.schedules.iloc[list(schedule)].copy()
+        result['Key'] = [self.__keys[row] for row in schedule]
+        result.drop(columns=['Department', 'Course', 'Section'], inplace=True)
+        result['Count'] = [self.__group_sizes[row] for row in schedule]
+        return result.astype(object).reset_index(drop=True)
+
+    def __materialize_classes(self, schedule):
+        # a schedule of representatives, with the sections any of which can be taken instead
+        result = self.__materialize(schedule)
+        result['Sections'] = ['/'.join(self.__section_names[member] for member in self.__class_members[self.__patterns_of[row]]) for row in schedule]
+        return result
+
+    def __search_parallel(self, combos, per_combo, limit, workers):
+        chunks = iter(lambda: list(itertools.islice(combos, COMBOS_PER_TASK)), [])
+
+        # the catalog goes to each worker once through the initializer, tasks only carry combinations
+        executor = concurrent.futures.ProcessPoolExecutor(workers, initializer=init_worker, initargs=(self,))
+        try:
+            # keep a few tasks per worker in flight and hand results back in submission order,
+            # so the output is the same as the serial search; when ranking each task also gets
+            # the score to beat as of when it was sent
+            pending = collections.deque()
+            for chunk in itertools.islice(chunks, workers * 4):
+                pending.append((len(chunk), executor.submit(search_worker, chunk, per_combo, limit, self.__cutoff())))
+
+            while pending:
+                size, future = pending.popleft()
+                schedules, (timings, counters) = future.result()
+                self.metrics.merge(timings, counters)
+                yield size, schedules
+                for chunk in itertools.islice(chunks, 1):
+                    pending.append((len(chunk), executor.submit(search_worker, chunk, per_combo, limit, self.__cutoff())))
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    def __search(self, per_combo, limit, workers, skip=0):
+        # batches of (score, rows) pairs with the number of combinations each covers, scores are
+        # only filled in when a worker already ranked them. the first skip combinations are
+        # generated but not searched
+        self.__forbidden = self.__compile_time_limits()
+
+        print("Searching combinations and filtering time and date restrictions...")
+
+        combos = self.metrics.timed_iter('combination generation', self.__generate_combos())
+        if skip:
+            combos = itertools.islice(combos, skip, None)
+        if workers is None or workers <= 1:
+            batches = ((1, ((None, schedule) for schedule in self.__iter_combo(combo, per_combo))) for combo in combos)
+        else:
+            batches = self.__search_parallel(combos, per_combo, limit, workers)
 
-            schedule = self.schedules[self.schedules['Key'].isin(courses['Key'])]
+        num_combos = skip
+        last_report = time.monotonic()
 
-            if (len(courses['Key'].unique()) != self.params['num_courses']):
-                continue
+        for size, schedules in batches:
+            yield size, schedules
+
+            num_combos += size
+            if time.monotonic() - last_report >= PROGRESS_INTERVAL:
+                last_report = time.monotonic()
+                print(f"{num_combos} combinations checked")
+                self.metrics.emit('progress', combinations=num_combos, schedules=self.metrics.counters['schedules found'])
+
+    def __tightens(self, previous):
+        # whether every schedule allowed by the current parameters was allowed by the previous
+        # ones, so the current answer is among the previous one
+        old, new = previous['Params'], self.params
+
+        if old['num_courses'] != new['num_courses']:
+            return False
+        # time limits can only have grown
+        if previous['Forbidden'] & ~self.__forbidden:
+            return False
+        for param in ['uniqueDeps', 'uniqueListings']:
+            if old[param] and not new[param]:
+                return False
+        # exclusions and count rules can only have been added
+        for param in ['exclude', 'must_haves', 'at_least', 'at_most', 'must_select']:
+            if any(item not in new[param] for item in old[param]):
+                return False
+        # day limits can only have been lowered or added
+        for day, day_limit in old['day_limits'].items():
+            if day not in new['day_limits'] or new['day_limits'][day] > day_limit:
+                return False
 
-            schedule['Section'] = schedule['Section'].str[0]
-            schedule['Key'] = schedule['Department'] + schedule['Course'].astype(str) + schedule['Section']
-            schedule.drop(columns=['Department', 'Course', 'Section'], inplace=True)
+        return True
 
-            key_counts = schedule['Key'].value_counts().reset_index()
-            key_counts.columns = ['Key', 'Count']
-            schedule = schedule.merge(key_counts, on='Key')
-            schedule = schedule.sort_values(by=['Count'])
-            keys = schedule['Key'].unique()
+    def __passing(self, results, candidates, rules):
+        # which of results keep to the current time limits, day limits, exclusions and count
+        # rules, checked for all of them at once over their rows back to back
+        rows = np.frombuffer(results.rows, dtype=np.int32)
+        starts = np.frombuffer(results.offsets, dtype=np.int64)[:-1]
+        courses = self.__course_ids[rows]
+
+        allowed = np.array([not (span & self.__forbidden) for span in self.__spans])
+        passing = np.logical_and.reduceat(allowed[rows], starts)
+
+        for day, day_limit in self.params['day_limits'].items():
+            if day in DAYS:
+                meetings = (self.__day_bits[rows] >> DAYS.index(day)) & 1
+                passing &= np.add.reduceat(meetings, starts) <= day_limit
+
+        usable = np.array([(candidates >> position) & 1 for position in range(len(self.courses))], dtype=bool)
+        passing &= np.logical_and.reduceat(usable[courses], starts)
+
+        # a schedule has a section of every group of its courses, so counting the sections of
+        # each course's first group counts its courses
+        first_keys = dict()
+        for row, key in enumerate(self.__keys):
+            first_keys.setdefault(self.__course_ids[row], key)
+        firsts = np.array([key == first_keys[course] for key, course in zip(self.__keys, self.__course_ids)])
+        if rules:
+            membership = np.array([[(rule['Members'] >> position) & 1 for position in range(len(self.courses))] for rule in rules], dtype=np.int16)
+            counts = np.add.reduceat(membership[:, courses] * firsts[rows], starts, axis=1)
+            lowest = np.array([rule['Lowest'] for rule in rules])[:, None]
+            highest = np.array([rule['Highest'] for rule in rules])[:, None]
+            passing &= ((counts >= lowest) & (counts <= highest)).all(axis=0)
+
+        return passing, courses.astype(np.int32).tobytes()
+
+    def __resolve(self, previous, per_combo):
+        # the previous results filtered with the current parameters, in the order a new search
+        # would find them. tighter parameters only take schedules out, so a combination's
+        # schedules now are the ones it had before that still pass, and a combination only has to
+        # be searched again when too few of its earlier schedules pass and it may have had more
+        candidates, rules, removed = self.__compile_rules()
+        print("Filtering the previous schedules with the tightened parameters...")
+
+        results = previous['Results']
+        old_per_combo = previous['Per Combo']
+        if len(results) == 0:
+            return
+
+        with self.metrics.phase('refilter'):
+            passing, courses = self.__passing(results, candidates, rules)
+        self.metrics.counters['schedules refiltered'] += len(results)
+
+        # a combination's schedules are next to each other and their sections belong to the same
+        # courses in the same order, so the course sequence tells where each combination starts
+        offsets = results.offsets
+        first = 0
+        while first < len(results):
+            signature = courses[4 * offsets[first]:4 * offsets[first + 1]]
+            last = first + 1
+            while last < len(results) and courses[4 * offsets[last]:4 * offsets[last + 1]] == signature:
+                last += 1
+
+            self.metrics.counters['combinations searched'] += 1
+            kept = [results.schedule_rows(index) for index in range(first, last) if passing[index]]
+
+            if per_combo is not None and len(kept) >= per_combo:
+                kept = kept[:per_combo]
+            elif old_per_combo is not None and last - first >= old_per_combo:
+                # it may have had more schedules than were kept last time, which the rules can't
+                # have taken out if the combination itself still passes
+                combo = tuple(sorted(set(np.frombuffer(signature, dtype=np.int32).tolist())))
+                if self.__check_combo(combo, candidates, rules):
+                    self.metrics.counters['combinations searched again'] += 1
+                    kept = list(self.__iter_combo(combo, per_combo))
+
+            if kept:
+                self.metrics.counters['combinations with schedules'] += 1
+            self.metrics.counters['schedules found'] += len(kept)
+            yield 1, [(None, schedule) for schedule in kept]
+
+            first = last
+
+    def __check_combo(self, combo, candidates, rules):
+        if any(not (candidates >> position) & 1 for position in combo):
+            return False
+        return bool(self.__check_batch(rules, np.array([combo], dtype=np.int64)).all())
+
+    def __iter_rows(self, limit, per_combo, workers, previous=None):
+        num_combos = 0
+        num_schedules = 0
+
+        batches = self.__search(per_combo, limit, workers) if previous is None else self.__resolve(previous, per_combo)
+        for size, schedules in batches:
+            num_combos += size
+            for score, schedule in schedules:
+                yield schedule
+
+                num_schedules += 1
+                if limit is not None and num_schedules >= limit:
+                    print(f"Stopped at {num_schedules} schedules after {num_combos} combinations")
+                    return
+
+        print(f"Checked {num_combos} combinations, found {num_schedules} schedules")
+
+    def iter_schedules(self, limit=None, per_combo=None, workers=None, expand=True):
+        # with expand=False, sections that meet at the same times as another of the same group
+        # aren't given schedules of their own, each schedule lists them under Sections instead
+        self.metrics.reset()
+        self.__expand_classes = expand
+        try:
+            for schedule in self.__iter_rows(limit, per_combo, workers):
+                yield self.__materialize(schedule) if expand else self.__materialize_classes(schedule)
+        finally:
+            self.__expand_classes = True
+        self.metrics.emit('done', **self.metrics.summary())
+
+    def __fingerprint(self):
+        # what a run streamed to disk was started with, which resuming it has to match.
+        # preferences only rank schedules, so they don't change which are found
+        params = {key: value for key, value in self.params.items() if key != 'preferences'}
+        catalog = hashlib.sha1(repr(self.catalog.courses).encode())
+        for values in [self.catalog.group_ids, self.catalog.section_codes, self.catalog.day_bits, self.catalog.starts, self.catalog.ends]:
+            catalog.update(np.ascontiguousarray(values).tobytes())
+        return {'Params': repr(params), 'Catalog': catalog.hexdigest()}
+
+    def __records(self, expand):
+        # every catalog row the way a sink writes it out
+        records = self.catalog.to_frame().to_dict('records')
+        if not expand:
+            for row, record in enumerate(records):
+                record['Sections'] = '/'.join(self.__section_names[member] for member in self.__class_members[self.__patterns_of[row]])
+        return records
+
+    def __stream(self, directory, sink_format, resume, limit, per_combo, workers, expand):
+        # the schedules go to a sink in directory as they are found instead of into memory, with
+        # checkpoints of how many combinations are done. resuming skips those combinations and
+        # carries on after the schedules already written. a run is only complete once every
+        # combination is searched, so a run stopped by its limit can be resumed with a higher one
+        if sink_format not in SINKS:
+            raise ValueError(f"sink_format must be one of {list(SINKS)}")
+        sink_class, reader = SINKS[sink_format]
+
+        os.makedirs(directory, exist_ok=True)
+        run = dict(self.__fingerprint(), **{'Per Combo': per_combo, 'Expand': expand})
+
+        checkpoint = read_checkpoint(directory) if resume else None
+        if checkpoint is not None:
+            if checkpoint['Format'] != sink_format:
+                raise ValueError(f"{directory} was written as {checkpoint['Format']}, not {sink_format}")
+            changed = [key for key, value in run.items() if checkpoint[key] != value]
+            if changed:
+                raise ValueError(f"can't resume {directory}, {', '.join(changed)} changed since it was started")
+
+        self.metrics.reset()
+        self.__write_params(directory)
+        sink = sink_class(directory, self.__records(expand), run, checkpoint)
+        num_combos = sink.checkpoint['Combinations']
+        num_schedules = sink.checkpoint['Schedules']
+        complete = sink.checkpoint['Complete']
+        stopped = limit is not None and num_schedules >= limit
+        if checkpoint is not None:
+            print(f"Resuming {directory} after {num_combos} combinations and {num_schedules} schedules")
+
+        self.__expand_classes = expand
+        try:
+            with self.metrics.profiled('generate_schedules'):
+                if not complete and not stopped:
+                    remaining = None if limit is None else limit - num_schedules
+                    for size, schedules in self.__search(per_combo, remaining, workers, num_combos):
+                        for score, schedule in schedules:
+                            sink.add(num_schedules, schedule)
+                            num_schedules += 1
+                            if num_schedules == limit:
+                                break
+                        if num_schedules == limit:
+                            # the batch may have had more schedules, so the checkpoint stays before
+                            # it and resuming searches it again
+                            stopped = True
+                            break
+                        num_combos += size
+                        sink.mark(num_combos, num_schedules)
+                    else:
+                        complete = True
+        finally:
+            # an interrupted run keeps everything up to the last combination it finished, one
+            # stopped by its limit also keeps the schedules found after that for its results
+            sink.close(complete, stopped)
+            self.__expand_classes = True
+        self.metrics.emit('done', **self.metrics.summary())
+
+        if limit is not None:
+            num_schedules = min(num_schedules, limit)
+        if stopped:
+            print(f"Stopped at {num_schedules} schedules after {num_combos} combinations, written to {directory}")
+        else:
+            print(f"Checked {num_combos} combinations, {num_schedules} schedules written to {directory}")
+
+        written = dict(sink.checkpoint)
+        self.results = StreamedResults(self.__materialize if expand else self.__materialize_classes, lambda: reader(directory, written, num_schedules), num_schedules)
+        self.scores = None
+        return num_schedules
+
+    def generate_schedules(self, limit=None, per_combo=1, workers=None, expand=True, sink=None, sink_format='jsonl', resume=False):
+        # with expand=False, see iter_schedules. with a sink directory the schedules are written
+        # there as they are found, as 'jsonl' or 'parquet', and self.results reads them back from
+        # it; resume=True carries on from the last checkpoint of an interrupted run in it
+        if sink is not None:
+            return self.__stream(sink, sink_format, resume, limit, per_combo, workers, expand)
+        if resume:
+            raise ValueError("resume needs the sink directory of the run to resume")
+
+        self.metrics.reset()
+        self.__forbidden = self.__compile_time_limits()
+
+        # after update_param only tightened things, the last complete results are filtered
+        # instead of searching again
+        previous = self.__solved
+        if previous is not None and (previous['Expand'] != expand or not self.__tightens(previous)):
+            previous = None
+
+        self.__expand_classes = expand
+        # with no limit and no per_combo every schedule of every combination ends up in
+        # self.results, so holding a combination's schedules to sort them costs nothing extra
+        self.__mrv = limit is None and per_combo is None
+        try:
+            with self.metrics.profiled('generate_schedules'):
+                self.results = ScheduleResults(self.__materialize if expand else self.__materialize_classes)
+                for schedule in self.__iter_rows(limit, per_combo, workers, previous):
+                    self.results.append(schedule)
+                self.scores = None
+        finally:
+            self.__expand_classes = True
+            self.__mrv = False
+        self.metrics.emit('done', **self.metrics.summary())
+
+        # a run that wasn't cut short by the limit has every combination's schedules (up to
+        # per_combo of them), so it can be filtered next time
+        if limit is None or len(self.results) < limit:
+            self.__solved = {'Params': copy.deepcopy(self.params), 'Forbidden': self.__forbidden, 'Per Combo': per_combo, 'Expand': expand, 'Results': self.results}
 
-            attempt = self.__find_combination(schedule, keys, [])
+        return len(self.results)
 
-            if not attempt:
-                num_combos -= 1
-                if num_combos % 100 == 0:
-                    print(f"{num_combos} combinations remaining")
+    def best_schedules(self, top_k=10, per_combo=None, workers=None):
+        if not self.params['preferences']:
+            raise ValueError("best_schedules needs preferences to rank by")
+
+        self.__top_k = top_k
+        self.__best = []
+        self.__order = 0
+        self.__cutoff_floor = None
+        # partial schedules only bound complete ones when every preference is a built in,
+        # never shrinking cost with a nonnegative weight
+        self.__pruning = all(not callable(scorer) and weight >= 0 for scorer, weight in self.params['preferences'].items())
+
+        self.metrics.reset()
+        try:
+            with self.metrics.profiled('best_schedules'):
+                num_combos = 0
+                for size, schedules in self.__search(per_combo, None, workers):
+                    num_combos += size
+                    for score, schedule in schedules:
+                        self.__offer(schedule, score)
+
+                ranked = self.__ranked()
+        finally:
+            self.__top_k = None
+            self.__best = []
+        self.metrics.emit('done', **self.metrics.summary())
+
+        print(f"Checked {num_combos} combinations, kept the best {len(ranked)} schedules")
+
+        self.results = ScheduleResults(self.__materialize)
+        for score, schedule in ranked:
+            self.results.append(schedule)
+        self.scores = [score for score, schedule in ranked]
 
         return len(self.results)
 
-    def __get_text_dimensions(self, text_string, font):
-        # https://stackoverflow.com/a/46220683/9263761
-        ascent, descent = font.getmetrics()
-
-        text_width = font.getmask(text_string).getbbox()[2]
-        text_height = font.getmask(text_string).getbbox()[3] + descent
-
-        return text_width, text_height
-
-    def __draw_schedule(self, schedule, filepath):
-        # Convert start and end times to datetime objects
-        # schedule['Start'] = pd.to_datetime(schedule['Start'])
-        # schedule['End'] = pd.to_datetime(schedule['End'])
-
-        #specify format 
-        schedule['Start'] = pd.to_datetime(schedule['Start'], format='%H:%M:%S')
-        schedule['End'] = pd.to_datetime(schedule['End'], format='%H:%M:%S')
-
-        # generate a list of pastel colors
-        classes = [x[:-1] for x in list(schedule['Key'].unique())]
-        palette = sns.color_palette('pastel', len(classes)).as_hex()
-
-        colors = {}
-        for j, c in enumerate(classes):
-            colors[c] = palette[j]
-
-        # Create a blank image with the desired size
-        width = 3000
-        height = 2400
-        image = Image.new('RGB', (width + 1, height), 'white')
-        draw = ImageDraw.Draw(image)
-
-        time_font = ImageFont.truetype('arial.ttf', 40)
-        day_font = ImageFont.truetype('arial.ttf', 60)
-        class_font = ImageFont.truetype('arial.ttf', 36)
-        legend_font = ImageFont.truetype('arial.ttf', 48)
-
-        # Define the width and height of each time slot
-        time_slot_width = width // 5
-        time_slot_height = height // 24
-
-        # Draw day labels on top
-        for day_idx, day in enumerate(['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']):
-            text_width, text_height = self.__get_text_dimensions(day, font=day_font)
-            x = day_idx * time_slot_width + (time_slot_width - text_width) // 2
-            y = 5  # Some padding
-            draw.text((x, y), day, font=day_font, fill='black')
-
-        # Draw the time slots for each day and draw time labels on the left
-        for day_idx, day in enumerate(['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']):
-            for hour in range(24):
-                top_left = (day_idx * time_slot_width, hour * time_slot_height)
-                bottom_right = ((day_idx + 1) * time_slot_width, (hour + 1) * time_slot_height)
-                draw.rectangle([top_left, bottom_right], outline='black')
-
-        # Draw the course schedule
-        for idx, row in schedule.iterrows():
-            key = row['Key']
-            name = row['Name']
-            days = row['Days']
-            start_hour = row['Start'].hour
-            start_minute = row['Start'].minute
-            end_hour = row['End'].hour
-            end_minute = row['End'].minute
-            color = colors[key[:-1]]
-
-            for day in days:
-                day_idx = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday'].index(day)
-                top_left = (day_idx * time_slot_width, start_hour * time_slot_height + (start_minute / 60) * time_slot_height)
-                bottom_right = (day_idx * time_slot_width + time_slot_width, end_hour * time_slot_height + (end_minute / 60) * time_slot_height)
-                draw.rectangle([top_left, bottom_right], fill=color)
-
-                # Draw class labels (Key)
-                class_label = f"{key} ({start_hour:02}:{start_minute:02} - {end_hour:02}:{end_minute:02})"
-                text_width, text_height = self.__get_text_dimensions(class_label, font=class_font)
-                x = day_idx * time_slot_width + (time_slot_width - text_width) // 2
-                y = start_hour * time_slot_height + (start_minute / 60) * time_slot_height + (time_slot_height - text_height) // 2
-                draw.text((x, y), class_label, font=class_font, fill='black')
-
-        max_name_length = 0
-        texts = []
-
-        # Create a list of all keys and names
-        key_name_pairs = {}
-        for idx, row in schedule.iterrows():
-            key = row['Key'][:6]
-            name = row['Name']
-            key_name_pairs[key]=name
-
-        for idx, key in enumerate(key_name_pairs.keys()):
-            text = f"{key} - {key_name_pairs[key]}"
-            # for each text, if there are more than 15 characters, look for a space after 15 characters and split into two lines
-            for line in range(len(text) // 20):
-                for i in range(20*(line+1), len(text)):
-                    if text[i] == ' ':
-                        text = text[:i] + '\n' + text[i+1:]
+    def __course_patterns(self, day_limits):
+        # sections that meet at the same times are interchangeable when counting, so every
+        # distinct meeting pattern inside the time limits gets an index, with the patterns it
+        # clashes with as a bitset of indices. each course's groups become how many of their
+        # sections have each pattern, a group with no section left staying in as an empty one
+        rows = [row for row, span in enumerate(self.__spans) if not span & self.__forbidden]
+        pattern_ids, patterns = pd.factorize(pd.Series(list(zip(self.__day_bits[rows].tolist(), self.__starts[rows].tolist(), self.__ends[rows].tolist())), dtype=object))
+        days = np.array([pattern[0] for pattern in patterns], dtype=np.uint8)
+        starts = np.array([pattern[1] for pattern in patterns], dtype=np.int16)
+        ends = np.array([pattern[2] for pattern in patterns], dtype=np.int16)
+        clashes = ((days[:, None] & days[None, :]) != 0) & (starts[:, None] <= ends[None, :]) & (ends[:, None] >= starts[None, :])
+        self.__pattern_clashes = [sum(1 << int(other) for other in np.flatnonzero(row)) for row in clashes]
+        self.__pattern_days = days.tolist()
+
+        groups = [dict() for course in self.courses]
+        for row, course in enumerate(self.__course_ids.tolist()):
+            groups[course].setdefault(self.__keys[row], collections.Counter())
+        for row, pattern in zip(rows, pattern_ids.tolist()):
+            groups[self.__course_ids[row]][self.__keys[row]][pattern] += 1
+
+        self.__patterns = [list(course_groups.values()) for course_groups in groups]
+        # every pattern a course could use, to see which parts of a partial schedule can still matter
+        self.__course_reach = [sum(1 << pattern for group in course_groups for pattern in group) for course_groups in self.__patterns]
+
+        # every way of placing a whole course, a pattern for each of its groups that don't clash
+        # with each other, as which patterns it uses, how many choices of sections have them and
+        # how many sections it puts on each limited day. the last course of a combination is
+        # counted from these for all partial schedules at once
+        uses, weights, day_counts, self.__assignment_spans = [], [], [], []
+        for course_groups in self.__patterns:
+            start = len(weights)
+            for choice in itertools.product(*[list(group.items()) for group in course_groups]):
+                used = 0
+                weight = 1
+                for pattern, sections in choice:
+                    if self.__pattern_clashes[pattern] & used:
                         break
-            # trim text of white space at beginning and end
-            text = text.strip()     
-            longest_line = max(text.split('\n'), key=len)
-            text_width, text_height = self.__get_text_dimensions(longest_line, font=class_font)
-            texts.append(text)
-            if text_width > max_name_length:
-                max_name_length = text_width
-
-        extra_width = int(width * 0.05 + max_name_length*1.2)
-
-        # Create a new image with added blank space on the left
-        new_width = width + extra_width
-        new_image = Image.new('RGB', (new_width, height), 'white')
-        # Paste the original image onto the new image, shifted to the right
-        new_image.paste(image, (int(width*0.05), 0))
-        image = new_image
-        draw = ImageDraw.Draw(image)
-
-        for hour in range(24):
-            text = f'{hour:02}:00'
-            text_width, text_height = self.__get_text_dimensions(text, font=time_font)
-            x = 5  # Some padding
-            y = hour * time_slot_height + (time_slot_height - text_height) // 2
-            draw.text((x, y), text, font=time_font, fill='black')
-       
-
-        # Draw the texts on the right
-        for idx, text in enumerate(texts):
-            text_width, text_height = self.__get_text_dimensions(text, font=legend_font)
-            x = int(width * 1.05 + max_name_length*0.1)
-            y = (idx*1.5+7) * time_slot_height + (time_slot_height - text_height) // 2
-            draw.text((x, y), text, font=class_font, fill='black')
-
-        image.save(filepath)
-
-    def draw_schedules(self):
+                    used |= 1 << pattern
+                    weight *= sections
+                else:
+                    uses.append([pattern for pattern, sections in choice])
+                    weights.append(weight)
+                    day_counts.append([sum(self.__pattern_days[pattern] >> bit & 1 for pattern, sections in choice) for bit, day_limit in day_limits])
+            self.__assignment_spans.append((start, len(weights)))
+
+        self.__assignments = [[] for course in self.courses]
+        for position, (start, end) in enumerate(self.__assignment_spans):
+            for assignment in range(start, end):
+                clashes = functools.reduce(operator.or_, [self.__pattern_clashes[pattern] for pattern in uses[assignment]], 0)
+                self.__assignments[position].append((sum(1 << pattern for pattern in uses[assignment]), clashes, weights[assignment], tuple(day_counts[assignment])))
+
+        self.__assignment_patterns = np.zeros((len(weights), len(patterns)), dtype=np.float32)
+        for assignment, patterns_used in enumerate(uses):
+            self.__assignment_patterns[assignment, patterns_used] = 1
+        self.__assignment_weights = np.array(weights, dtype=np.int64)
+        self.__assignment_days = np.array(day_counts, dtype=np.int64).reshape(len(weights), len(day_limits))
+
+    def __reach(self, candidates):
+        # the patterns the courses in candidates could use and the days those meet on
+        reach = 0
+        while candidates:
+            position = (candidates & -candidates).bit_length() - 1
+            candidates &= candidates - 1
+            reach |= self.__course_reach[position]
+        reach_days = 0
+        for pattern in range(reach.bit_length()):
+            if reach >> pattern & 1:
+                reach_days |= self.__pattern_days[pattern]
+        return reach, reach_days
+
+    def __place_course(self, states, position, candidates, day_limits):
+        # the partial schedules after also placing a course, as how many ways there are to reach
+        # each set of clashing patterns and count of sections on every limited day. only the
+        # patterns the courses still to pick could use, and the limited days they meet on, tell
+        # partial schedules apart from here on, so the rest is dropped and states that now look
+        # the same are counted together
+        reach, reach_days = self.__reach(candidates)
+        kept_days = [reach_days >> bit & 1 for bit, day_limit in day_limits]
+
+        placed = collections.Counter()
+        produced = 0
+        for (blocked, days), ways in states.items():
+            for uses, clashes, weight, course_days in self.__assignments[position]:
+                if uses & blocked:
+                    continue
+                if day_limits:
+                    new_days = tuple(count + added for count, added in zip(days, course_days))
+                    if any(count > day_limit for count, (bit, day_limit) in zip(new_days, day_limits)):
+                        continue
+                    new_days = tuple(count if kept else 0 for count, kept in zip(new_days, kept_days))
+                else:
+                    new_days = days
+                placed[((blocked | clashes) & reach, new_days)] += ways * weight
+                produced += 1
+        self.metrics.counters['count states'] += len(placed)
+        # every placement that landed on a state another one already reached was merged into it
+        self.metrics.counters['count placements'] += produced
+        self.metrics.counters['count states merged'] += produced - len(placed)
+        return placed
+
+    def __tally(self, combo, total, tally):
+        tally['Course Sets'] += 1
+        tally['Schedules'] += total
+        for position in combo:
+            tally['Courses'][position][0] += 1
+            tally['Courses'][position][1] += total
+        for department in {self.courses[position]['Department'] for position in combo}:
+            tally['Departments'][department][0] += 1
+            tally['Departments'][department][1] += total
+
+    def __count_last(self, rules, combo, counts, choices, states, tally):
+        # the schedules of every combination finished by one of choices, counted for all of them
+        # and all partial schedules at once: an assignment of a course fits a partial schedule
+        # when it uses none of the patterns the schedule clashes with and keeps to the day limits
+        positions = []
+        while choices:
+            position = (choices & -choices).bit_length() - 1
+            choices &= choices - 1
+            if all(rule['Lowest'] <= count + ((rule['Members'] >> position) & 1) <= rule['Highest'] for rule, count in zip(rules, counts)):
+                if self.__assignment_spans[position][1] > self.__assignment_spans[position][0]:
+                    positions.append(position)
+        if not positions:
+            return
+
+        keys = list(states)
+        ways = np.array([states[key] for key in keys], dtype=np.int64)
+        num_patterns = self.__assignment_patterns.shape[1]
+        width = max(-(-num_patterns // 8), 1)
+        packed = np.frombuffer(b''.join(blocked.to_bytes(width, 'little') for blocked, days in keys), dtype=np.uint8).reshape(len(keys), width)
+        blocked = np.unpackbits(packed, axis=1, bitorder='little')[:, :num_patterns].astype(np.float32)
+
+        assignments = np.concatenate([np.arange(*self.__assignment_spans[position]) for position in positions])
+        fits = (blocked @ self.__assignment_patterns[assignments].T) == 0
+        if tally['Day Limits']:
+            days = np.array([days for blocked, days in keys], dtype=np.int64)
+            for index, (bit, day_limit) in enumerate(tally['Day Limits']):
+                fits &= days[:, index, None] + self.__assignment_days[assignments, index][None, :] <= day_limit
+
+        totals = (ways @ fits.astype(np.int64)) * self.__assignment_weights[assignments]
+        starts = np.cumsum([0] + [self.__assignment_spans[position][1] - self.__assignment_spans[position][0] for position in positions[:-1]])
+        self.metrics.counters['count states'] += len(keys)
+
+        for position, total in zip(positions, np.add.reduceat(totals, starts).tolist()):
+            if total:
+                combo.append(position)
+                self.__tally(combo, total, tally)
+                combo.pop()
+
+    def __count_combos(self, rules, combo, counts, candidates, states, tally):
+        # the same walk over combinations as __search_combos, carrying the partial schedule states
+        # of the courses picked so far, so combinations that share courses share their work and a
+        # branch stops as soon as its courses can't be taken together
+        slots = self.params['num_courses'] - len(combo)
+        day_limits = tally['Day Limits']
+
+        choices = self.__choices(rules, counts, candidates, slots)
+        if slots == 1:
+            self.__count_last(rules, combo, counts, choices, states, tally)
+            return
+
+        adjacency = self.__graph['Adjacency']
+        while choices:
+            position = (choices & -choices).bit_length() - 1
+            choices &= choices - 1
+            later = candidates >> (position + 1) << (position + 1)
+
+            for rule_index, rule in enumerate(rules):
+                counts[rule_index] += (rule['Members'] >> position) & 1
+
+            if self.__blocked(rules, counts, later & adjacency[position], slots - 1) is None:
+                placed = self.__place_course(states, position, later & adjacency[position], day_limits)
+                if placed:
+                    combo.append(position)
+                    self.__count_combos(rules, combo, counts, later & adjacency[position], placed, tally)
+                    combo.pop()
+
+            for rule_index, rule in enumerate(rules):
+                counts[rule_index] -= (rule['Members'] >> position) & 1
+
+    def count_schedules(self, by=None):
+        # how many combinations of courses have a schedule and how many schedules there are in
+        # all, the number generate_schedules(per_combo=None) would find, without building any of
+        # them. by='Course' or by='Department' breaks the counts down instead, as a DataFrame of
+        # how many of each are among the course sets and schedules
+        if by not in [None, 'Course', 'Department']:
+            raise ValueError(f"Can't count schedules by {by}, expected None, 'Course' or 'Department'")
+
+        self.metrics.reset()
+        with self.metrics.profiled('count_schedules'):
+            self.__forbidden = self.__compile_time_limits()
+            candidates, rules, removed = self.__compile_rules()
+            day_limits = [(DAYS.index(day), day_limit) for day, day_limit in self.params['day_limits'].items() if day in DAYS]
+            self.__course_patterns(day_limits)
+
+            # course sets and schedules with each course and each department in them
+            tally = {'Course Sets': 0, 'Schedules': 0, 'Courses': [[0, 0] for course in self.courses],
+                     'Departments': {course['Department']: [0, 0] for course in self.courses}, 'Day Limits': day_limits}
+            counts = [0] * len(rules)
+            if self.__blocked(rules, counts, candidates, self.params['num_courses']) is None:
+                self.__count_combos(rules, [], counts, candidates, {(0, (0,) * len(day_limits)): 1}, tally)
+        self.metrics.emit('done', **self.metrics.summary())
+
+        print(f"{tally['Course Sets']} combinations of courses have schedules, {tally['Schedules']} schedules in all")
+
+        if by is None:
+            return {'Course Sets': tally['Course Sets'], 'Schedules': tally['Schedules']}
+
+        if by == 'Course':
+            rows = [(course['Department'] + str(course['Course']), *counts) for course, counts in zip(self.courses, tally['Courses'])]
+        else:
+            rows = [(department, *counts) for department, counts in tally['Departments'].items()]
+        breakdown = pd.DataFrame(rows, columns=[by, 'Course Sets', 'Schedules'])
+        return breakdown.sort_values(by=['Schedules', by], ascending=[False, True]).reset_index(drop=True)
+
+    def __render(self, tasks, workers):
+        if workers is None or workers <= 1:
+            renderer = ScheduleRenderer()
+            for schedule, image_path in tasks:
+                renderer.draw(schedule).save(image_path)
+            return
+
+        # fonts and the empty grid are set up once per process, and only a few images per process
+        # are waiting at a time so results are materialized as they are drawn
+        with concurrent.futures.ProcessPoolExecutor(workers, initializer=init_renderer) as executor:
+            pending = collections.deque()
+            for schedule, image_path in tasks:
+                if len(pending) >= workers * 4:
+                    pending.popleft().result()
+                pending.append(executor.submit(render_worker, schedule, image_path))
+            for future in pending:
+                future.result()
+
+    def save_catalog(self, filename='schedules.xlsx'):
+        # the catalog the schedules are made from, upserted into a .db/.sqlite store, compiled into a
+        # .catalog file or exported as xlsx
+        if is_catalog_path(filename):
+            self.catalog.save(filename)
+        elif isinstance(filename, CatalogStore):
+            filename.upsert(self.schedules)
+        elif is_store_path(filename):
+            store = CatalogStore(filename)
+            store.upsert(self.schedules)
+            store.close()
+        else:
+            catalog = self.schedules.copy()
+            catalog['Days'] = catalog['Days'].apply(lambda days: str(list(days)))
+            catalog.to_excel(filename, index=False)
+
+    def __write_params(self, directory_name):
+        # Write the dictionary to a text file
+        params_filename = "params.txt"
+        params_file_path = os.path.join(directory_name, params_filename)
+
+        with open(params_file_path, "w") as params_file:
+            for key, value in self.params.items():
+                params_file.write(f"{key}: {value}\n")
+
+    def __write(self, directory_name, output, per_page):
+        # streams every schedule into one compact output, drawing them one at a time so only the
+        # page being written is held in memory
+        renderer = ScheduleRenderer()
+        if output == 'contact':
+            writer = WRITERS[output](renderer, directory_name, per_page=per_page)
+        else:
+            writer = WRITERS[output](renderer, directory_name)
+
+        try:
+            for i, result in enumerate(self.results):
+                writer.add(i, result)
+        finally:
+            writer.close()
+
+        self.__write_params(directory_name)
+        print(f'Schedules generated, {len(self.results)} written as {output} in {directory_name}')
+
+    def draw_schedules(self, directory=None, workers=None, output='png', per_page=12):
+        if output != 'png' and output not in WRITERS:
+            raise ValueError(f"output must be 'png' or one of {list(WRITERS)}")
+
         if len(self.results) != 0:
-            current_datetime = datetime.datetime.now()
-            formatted_datetime = current_datetime.strftime("%d_%m_%y_%H_%M_%S")
-            directory_name = f"schedules_{formatted_datetime}"
+            if directory is None:
+                current_datetime = datetime.datetime.now()
+                formatted_datetime = current_datetime.strftime("%d_%m_%y_%H_%M_%S")
+                directory_name = f"schedules_{formatted_datetime}"
+            else:
+                directory_name = directory
 
             # Create the directory in the current working directory
             try:
-                os.mkdir(directory_name)
-                print(f"Directory '{directory_name}' created successfully.")
+                os.makedirs(directory_name, exist_ok=directory is not None)
+                print(f"Directory '{directory_name}' ready.")
             except OSError:
                 print(f"Creation of directory '{directory_name}' failed.")
 
-            for i, result in enumerate(self.results):
-                schedule = result
-                filename = f"course_schedule{i}.png"
-                image_path = os.path.join(directory_name, filename)
-                self.__draw_schedule(schedule, image_path)
-
-            # Write the dictionary to a text file
-            params_filename = "params.txt"
-            params_file_path = os.path.join(directory_name, params_filename)
-
-            with open(params_file_path, "w") as params_file:
-                for key, value in self.params.items():
-                    params_file.write(f"{key}: {value}\n")
-
-            print('Schedules generated')
+            if output != 'png':
+                with self.metrics.profiled('rendering'):
+                    self.__write(directory_name, output, per_page)
+                self.metrics.counters['images drawn'] += len(self.results)
+                return
+
+            # content hash of every image already in the directory, so drawing into it again only
+            # renders schedules that aren't there yet
+            manifest_path = os.path.join(directory_name, "rendered.txt")
+            rendered = dict()
+            if os.path.exists(manifest_path):
+                with open(manifest_path) as manifest:
+                    for line in manifest:
+                        filename, content = line.split()
+                        if os.path.exists(os.path.join(directory_name, filename)):
+                            rendered[filename] = content
+
+            # images only show each section's key, name, days and times, which the catalog's
+            # fingerprint and its names cover, so the raw rows are hashed instead of whole schedules
+            catalog = hashlib.sha1(self.__fingerprint()['Catalog'].encode())
+            catalog.update(repr(self.catalog.names).encode())
+            catalog.update(np.ascontiguousarray(self.catalog.name_codes).tobytes())
+            catalog = catalog.hexdigest()
+            filenames = [f"course_schedule{i}.png" for i in range(len(self.results))]
+            contents = [schedule_hash(catalog, rows) for rows in self.results.iter_rows()]
+            drawing = dict(zip(filenames, contents))
+
+            sources = dict()
+            for filename, content in rendered.items():
+                sources.setdefault(content, filename)
+
+            tasks = []
+            copies = []
+            for i, (filename, content) in enumerate(zip(filenames, contents)):
+                if rendered.get(filename) == content:
+                    continue
+                elif content in sources:
+                    copies.append((sources[content], filename))
+                else:
+                    tasks.append(i)
+
+            # images copied from that are about to be replaced are moved aside first
+            moved = dict()
+            for source, filename in copies:
+                if source not in moved and drawing.get(source, rendered[source]) != rendered[source]:
+                    moved[source] = os.path.join(directory_name, f"{source}.old")
+                    os.replace(os.path.join(directory_name, source), moved[source])
+            for source, filename in copies:
+                shutil.copyfile(moved.get(source, os.path.join(directory_name, source)), os.path.join(directory_name, filename))
+            for path in moved.values():
+                os.remove(path)
+
+            with self.metrics.profiled('rendering'):
+                # one pass over the results, which streamed results can only read in order
+                tasks = set(tasks)
+                self.__render(((self.results.materialize(schedule), os.path.join(directory_name, filenames[i])) for i, schedule in enumerate(self.results.iter_rows()) if i in tasks), workers)
+            self.metrics.counters['images drawn'] += len(tasks)
+            self.metrics.counters['images reused'] += len(self.results) - len(tasks)
+
+            # images left from an earlier run with more results would pass for schedules of this one,
+            # so they go, and the manifest only lists the current images
+            removed = 0
+            for filename in os.listdir(directory_name):
+                match = re.fullmatch(r"course_schedule(\d+)\.png", filename)
+                if match and int(match.group(1)) >= len(self.results):
+                    os.remove(os.path.join(directory_name, filename))
+                    removed += 1
+            with open(manifest_path, "w") as manifest:
+                for filename, content in drawing.items():
+                    manifest.write(f"{filename} {content}\n")
+
+            self.__write_params(directory_name)
+
+            print(f'Schedules generated, {len(tasks)} drawn, {len(self.results) - len(tasks)} already in {directory_name} and {removed} old ones removed')
 
         else:
             print('No results')
-
-        
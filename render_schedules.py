@@ -0,0 +1,359 @@
+import datetime
+import hashlib
+import io
+import math
+import os
+from html import escape
+from PIL import Image, ImageDraw, ImageFont
+import seaborn as sns
+
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
+
+def schedule_hash(catalog, rows):
+    # a schedule's catalog rows along with a hash of everything the catalog puts in its image, so
+    # equal hashes mean equal images without building the schedule to find out
+    content = [int(row) for row in rows]
+    return hashlib.sha1(f"{catalog} {content}".encode()).hexdigest()
+
+class ScheduleRenderer:
+    # draws schedules the way ScheduleMaker always has, but loads the fonts and draws the empty
+    # grid once, so each schedule only adds its classes and legend on a copy
+    def __init__(self, font='arial.ttf', width=3000, height=2400):
+        self.width = width
+        self.height = height
+
+        self.time_font = ImageFont.truetype(font, 40)
+        self.day_font = ImageFont.truetype(font, 60)
+        self.class_font = ImageFont.truetype(font, 36)
+        self.legend_font = ImageFont.truetype(font, 48)
+
+        # Define the width and height of each time slot
+        self.time_slot_width = width // 5
+        self.time_slot_height = height // 24
+
+        self.__dimensions = dict()
+        self.__palettes = dict()
+        self.__grid = self.__draw_grid()
+
+    def get_text_dimensions(self, text_string, font):
+        # https://stackoverflow.com/a/46220683/9263761
+        if (text_string, font) not in self.__dimensions:
+            ascent, descent = font.getmetrics()
+            bbox = font.getmask(text_string).getbbox()
+            self.__dimensions[(text_string, font)] = (bbox[2], bbox[3] + descent)
+
+        return self.__dimensions[(text_string, font)]
+
+    def __draw_grid(self):
+        image = Image.new('RGB', (self.width + 1, self.height), 'white')
+        draw = ImageDraw.Draw(image)
+
+        # Draw day labels on top
+        for day_idx, day in enumerate(WEEKDAYS):
+            text_width, text_height = self.get_text_dimensions(day, font=self.day_font)
+            x = day_idx * self.time_slot_width + (self.time_slot_width - text_width) // 2
+            y = 5  # Some padding
+            draw.text((x, y), day, font=self.day_font, fill='black')
+
+        # Draw the time slots for each day
+        for day_idx, day in enumerate(WEEKDAYS):
+            for hour in range(24):
+                top_left = (day_idx * self.time_slot_width, hour * self.time_slot_height)
+                bottom_right = ((day_idx + 1) * self.time_slot_width, (hour + 1) * self.time_slot_height)
+                draw.rectangle([top_left, bottom_right], outline='black')
+
+        return image
+
+    def colors(self, schedule):
+        # a pastel color per class
+        classes = [x[:-1] for x in list(schedule['Key'].unique())]
+        if len(classes) not in self.__palettes:
+            self.__palettes[len(classes)] = sns.color_palette('pastel', len(classes)).as_hex()
+
+        return dict(zip(classes, self.__palettes[len(classes)]))
+
+    def blocks(self, schedule):
+        # the class blocks as (key, day index, start hour, start minute, end hour, end minute)
+        blocks = []
+        for idx, row in schedule.iterrows():
+            start = self.__to_time(row['Start'])
+            end = self.__to_time(row['End'])
+            for day in row['Days']:
+                blocks.append((row['Key'], WEEKDAYS.index(day), start.hour, start.minute, end.hour, end.minute))
+        return blocks
+
+    def __to_time(self, value):
+        if isinstance(value, str):
+            return datetime.datetime.strptime(value, '%H:%M:%S')
+        return value
+
+    def legend(self, schedule):
+        # Create a list of all keys and names
+        key_name_pairs = {}
+        for idx, row in schedule.iterrows():
+            key = row['Key'][:6]
+            name = row['Name']
+            key_name_pairs[key] = name
+
+        texts = []
+        max_name_length = 0
+        for idx, key in enumerate(key_name_pairs.keys()):
+            text = f"{key} - {key_name_pairs[key]}"
+            # for each text, if there are more than 15 characters, look for a space after 15 characters and split into two lines
+            for line in range(len(text) // 20):
+                for i in range(20*(line+1), len(text)):
+                    if text[i] == ' ':
+                        text = text[:i] + '\n' + text[i+1:]
+                        break
+            # trim text of white space at beginning and end
+            text = text.strip()
+            longest_line = max(text.split('\n'), key=len)
+            text_width, text_height = self.get_text_dimensions(longest_line, font=self.class_font)
+            texts.append(text)
+            if text_width > max_name_length:
+                max_name_length = text_width
+
+        return texts, max_name_length
+
+    def image_width(self, max_name_length):
+        # the grid plus blank space on the left for hours and on the right for the legend
+        return self.width + int(self.width * 0.05 + max_name_length*1.2)
+
+    def draw(self, schedule):
+        colors = self.colors(schedule)
+
+        image = self.__grid.copy()
+        draw = ImageDraw.Draw(image)
+
+        # Draw the course schedule
+        for key, day_idx, start_hour, start_minute, end_hour, end_minute in self.blocks(schedule):
+            top_left = (day_idx * self.time_slot_width, start_hour * self.time_slot_height + (start_minute / 60) * self.time_slot_height)
+            bottom_right = (day_idx * self.time_slot_width + self.time_slot_width, end_hour * self.time_slot_height + (end_minute / 60) * self.time_slot_height)
+            draw.rectangle([top_left, bottom_right], fill=colors[key[:-1]])
+
+            # Draw class labels (Key)
+            class_label = f"{key} ({start_hour:02}:{start_minute:02} - {end_hour:02}:{end_minute:02})"
+            text_width, text_height = self.get_text_dimensions(class_label, font=self.class_font)
+            x = day_idx * self.time_slot_width + (self.time_slot_width - text_width) // 2
+            y = start_hour * self.time_slot_height + (start_minute / 60) * self.time_slot_height + (self.time_slot_height - text_height) // 2
+            draw.text((x, y), class_label, font=self.class_font, fill='black')
+
+        texts, max_name_length = self.legend(schedule)
+
+        # Create a new image with added blank space on the left
+        new_image = Image.new('RGB', (self.image_width(max_name_length), self.height), 'white')
+        # Paste the grid onto the new image, shifted to the right
+        new_image.paste(image, (int(self.width*0.05), 0))
+        image = new_image
+        draw = ImageDraw.Draw(image)
+
+        for hour in range(24):
+            text = f'{hour:02}:00'
+            text_width, text_height = self.get_text_dimensions(text, font=self.time_font)
+            x = 5  # Some padding
+            y = hour * self.time_slot_height + (self.time_slot_height - text_height) // 2
+            draw.text((x, y), text, font=self.time_font, fill='black')
+
+        # Draw the texts on the right
+        for idx, text in enumerate(texts):
+            text_width, text_height = self.get_text_dimensions(text, font=self.legend_font)
+            x = int(self.width * 1.05 + max_name_length*0.1)
+            y = (idx*1.5+7) * self.time_slot_height + (self.time_slot_height - text_height) // 2
+            draw.text((x, y), text, font=self.class_font, fill='black')
+
+        return image
+
+    def svg(self, schedule):
+        # the same layout as draw, as a vector image that stays small and sharp at any size
+        colors = self.colors(schedule)
+        texts, max_name_length = self.legend(schedule)
+        left = int(self.width * 0.05)
+        width = self.image_width(max_name_length)
+
+        parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{self.height}" viewBox="0 0 {width} {self.height}" font-family="Arial, sans-serif">',
+            f'<rect width="{width}" height="{self.height}" fill="white"/>']
+
+        # Draw the class blocks under the grid lines
+        for key, day_idx, start_hour, start_minute, end_hour, end_minute in self.blocks(schedule):
+            x = left + day_idx * self.time_slot_width
+            top = start_hour * self.time_slot_height + (start_minute / 60) * self.time_slot_height
+            bottom = end_hour * self.time_slot_height + (end_minute / 60) * self.time_slot_height
+            parts.append(f'<rect x="{x}" y="{top:g}" width="{self.time_slot_width}" height="{bottom - top:g}" fill="{colors[key[:-1]]}"/>')
+
+        for day_idx in range(len(WEEKDAYS) + 1):
+            x = left + day_idx * self.time_slot_width
+            parts.append(f'<line x1="{x}" y1="0" x2="{x}" y2="{self.height}" stroke="black"/>')
+        for hour in range(24):
+            y = hour * self.time_slot_height
+            parts.append(f'<line x1="{left}" y1="{y}" x2="{left + self.width}" y2="{y}" stroke="black"/>')
+
+        # Draw day labels on top and time labels on the left
+        for day_idx, day in enumerate(WEEKDAYS):
+            x = left + day_idx * self.time_slot_width + self.time_slot_width // 2
+            parts.append(f'<text x="{x}" y="5" font-size="60" text-anchor="middle" dominant-baseline="hanging">{day}</text>')
+        for hour in range(24):
+            y = hour * self.time_slot_height + self.time_slot_height // 2
+            parts.append(f'<text x="5" y="{y}" font-size="40" dominant-baseline="middle">{hour:02}:00</text>')
+
+        # Draw class labels (Key)
+        for key, day_idx, start_hour, start_minute, end_hour, end_minute in self.blocks(schedule):
+            x = left + day_idx * self.time_slot_width + self.time_slot_width // 2
+            y = start_hour * self.time_slot_height + (start_minute / 60) * self.time_slot_height + self.time_slot_height // 2
+            class_label = f"{key} ({start_hour:02}:{start_minute:02} - {end_hour:02}:{end_minute:02})"
+            parts.append(f'<text x="{x}" y="{y:g}" font-size="36" text-anchor="middle" dominant-baseline="middle">{escape(class_label)}</text>')
+
+        # Draw the texts on the right
+        x = int(self.width * 1.05 + max_name_length*0.1)
+        for idx, text in enumerate(texts):
+            y = (idx*1.5+7) * self.time_slot_height
+            lines = ''.join(f'<tspan x="{x}" dy="{0 if line_idx == 0 else 1.2}em">{escape(line)}</tspan>' for line_idx, line in enumerate(text.split('\n')))
+            parts.append(f'<text y="{y:g}" font-size="36" dominant-baseline="hanging">{lines}</text>')
+
+        parts.append('</svg>')
+        return '\n'.join(parts)
+
+class ContactSheetWriter:
+    # tiles thumbnails of the schedules onto pages, saving each page as soon as it is full so only
+    # one page is ever held in memory
+    def __init__(self, renderer, directory, per_page=12, thumbnail_width=800):
+        self.renderer = renderer
+        self.directory = directory
+        self.per_page = per_page
+
+        self.columns = math.ceil(math.sqrt(per_page))
+        self.rows = math.ceil(per_page / self.columns)
+        self.cell_width = thumbnail_width
+        # the legend usually makes an image about a third wider than its grid
+        self.cell_height = thumbnail_width * renderer.height // int(renderer.width * 1.3)
+        self.caption_height = 50
+
+        self.page = None
+        self.count = 0
+        self.pages = 0
+
+    def add(self, index, schedule):
+        if self.page is None:
+            self.page = Image.new('RGB', (self.columns * self.cell_width, self.rows * (self.cell_height + self.caption_height)), 'white')
+
+        image = self.renderer.draw(schedule)
+        image.thumbnail((self.cell_width, self.cell_height))
+
+        x = (self.count % self.columns) * self.cell_width
+        y = (self.count // self.columns) * (self.cell_height + self.caption_height)
+        self.page.paste(image, (x, y + self.caption_height))
+        ImageDraw.Draw(self.page).text((x + 10, y + 5), f"Schedule {index}", font=self.renderer.time_font, fill='black')
+
+        self.count += 1
+        if self.count == self.per_page:
+            self.__save_page()
+
+    def __save_page(self):
+        self.page.save(os.path.join(self.directory, f"contact_sheet{self.pages}.png"))
+        self.page = None
+        self.count = 0
+        self.pages += 1
+
+    def close(self):
+        if self.page is not None:
+            self.__save_page()
+
+class PdfWriter:
+    # one page per schedule in a single pdf, each page written to the file once as soon as it is
+    # drawn. pillow's append mode rewrites the whole page tree for every page, so the pdf is put
+    # together here instead: every page's image goes in as a jpeg the way pillow stores it, and
+    # only the page tree and the index, which just list the pages, wait for close
+    def __init__(self, renderer, directory, filename='schedules.pdf'):
+        self.renderer = renderer
+        self.file = open(os.path.join(directory, filename), 'wb')
+        self.file.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        # byte offset of every object, by number. 1 is the catalog, 2 the page tree and 3 the
+        # document info, pages take the numbers after that
+        self.offsets = dict()
+        self.pages = []
+        self.next_object = 4
+        self.__object(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+
+    def __object(self, number, dictionary, stream=None):
+        self.offsets[number] = self.file.tell()
+        self.file.write(f"{number} 0 obj\n".encode() + dictionary)
+        if stream is not None:
+            self.file.write(b'\nstream\n' + stream + b'\nendstream')
+        self.file.write(b'\nendobj\n')
+
+    def add(self, index, schedule):
+        image = self.renderer.draw(schedule)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        jpeg = io.BytesIO()
+        image.save(jpeg, 'JPEG')
+        width, height = image.size
+
+        number = self.next_object
+        self.next_object += 3
+        self.__object(number, f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} /ColorSpace /DeviceRGB /BitsPerComponent 8 "
+                              f"/Filter /DCTDecode /Length {jpeg.tell()} >>".encode(), jpeg.getvalue())
+        content = f"q {width} 0 0 {height} 0 0 cm /Schedule Do Q".encode()
+        self.__object(number + 1, f"<< /Length {len(content)} >>".encode(), content)
+        self.__object(number + 2, f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width} {height}] /Resources << /XObject << /Schedule {number} 0 R >> >> "
+                                  f"/Contents {number + 1} 0 R >>".encode())
+        self.pages.append(number + 2)
+
+    def close(self):
+        kids = ' '.join(f"{page} 0 R" for page in self.pages)
+        self.__object(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(self.pages)} >>".encode())
+        self.__object(3, b'<< /Title (Schedules) >>')
+
+        # the cross reference table, one entry per object number in order
+        start = self.file.tell()
+        size = max(self.offsets) + 1
+        self.file.write(f"xref\n0 {size}\n0000000000 65535 f \n".encode())
+        self.file.write(''.join(f"{self.offsets[number]:010} 00000 n \n" for number in range(1, size)).encode())
+        self.file.write(f"trailer\n<< /Size {size} /Root 1 0 R /Info 3 0 R >>\nstartxref\n{start}\n%%EOF\n".encode())
+        self.file.close()
+
+class SvgWriter:
+    # one small svg file per schedule
+    def __init__(self, renderer, directory):
+        self.renderer = renderer
+        self.directory = directory
+
+    def add(self, index, schedule):
+        with open(os.path.join(self.directory, f"course_schedule{index}.svg"), "w", encoding="utf-8") as svg_file:
+            svg_file.write(self.renderer.svg(schedule))
+
+    def close(self):
+        pass
+
+class HtmlWriter:
+    # a single browsable page of every schedule as inline svg, written out as it goes
+    def __init__(self, renderer, directory, filename='schedules.html'):
+        self.renderer = renderer
+        self.file = open(os.path.join(directory, filename), "w", encoding="utf-8")
+        self.file.write('<!DOCTYPE html>\n<html>\n<head>\n<meta charset="utf-8">\n<title>Schedules</title>\n'
+            '<style>body { font-family: Arial, sans-serif; } figure { display: inline-block; margin: 10px; } svg { width: 700px; height: auto; border: 1px solid #ccc; }</style>\n'
+            '</head>\n<body>\n')
+
+    def add(self, index, schedule):
+        self.file.write(f'<figure id="schedule{index}">\n<figcaption>Schedule {index}</figcaption>\n{self.renderer.svg(schedule)}\n</figure>\n')
+
+    def close(self):
+        self.file.write('</body>\n</html>\n')
+        self.file.close()
+
+WRITERS = {
+    'contact': ContactSheetWriter,
+    'pdf': PdfWriter,
+    'svg': SvgWriter,
+    'html': HtmlWriter
+}
+
+# each rendering process keeps its own renderer, so fonts and the grid are loaded once per process
+worker_renderer = None
+
+def init_renderer():
+    global worker_renderer
+    worker_renderer = ScheduleRenderer()
+
+def render_worker(schedule, filepath):
+    worker_renderer.draw(schedule).save(filepath)
+    return filepath
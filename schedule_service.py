@@ -0,0 +1,413 @@
+import argparse
+import collections
+import concurrent.futures
+import contextlib
+import copy
+import datetime
+import http.client
+import http.server
+import io
+import json
+import os
+import signal
+import socket
+import socketserver
+import threading
+import time
+from compiled_catalog import DAYS
+from make_schedules import ScheduleMaker, SCORERS
+
+# a local service that loads the catalog once and answers schedule requests from a pool of
+# worker processes, each holding its own ScheduleMaker over the same catalog, e.g.
+#   python schedule_service.py schedules.xlsx --port 8765
+#   python schedule_service.py schedules.catalog --socket /tmp/schedules.sock
+# and from python
+#   client = ScheduleClient('http://127.0.0.1:8765')
+#   client.schedules(num_courses=4, day_limits={'Friday': 1}, limit=20)
+
+# ScheduleMaker arguments a request can set, by the name they have in maker.params
+PARAMS = {
+    'num_courses': 'num_courses',
+    'must_haves': 'must_haves',
+    'at_least': 'at_least',
+    'must_select': 'must_select',
+    'at_most': 'at_most',
+    'exclude': 'exclude',
+    'unique_deps': 'uniqueDeps',
+    'unique_listings': 'uniqueListings',
+    'day_limits': 'day_limits',
+    'time_limits': 'time_limits',
+    'preferences': 'preferences'
+}
+# what each action runs and the options it takes besides the parameters, with their defaults
+ACTIONS = {
+    'schedules': {'limit': 100, 'per_combo': 1},
+    'best': {'top_k': 10, 'per_combo': None},
+    'count': {'by': None}
+}
+
+# most schedules a request can ask for, as limit or top_k, since each is answered in full
+MAX_SCHEDULES = 1000
+# seconds a request may run when it doesn't say, and at most
+DEFAULT_TIMEOUT = 30
+MAX_TIMEOUT = 300
+# how much longer than its timeout the service waits for a request before giving up on it, in
+# case the worker can't be interrupted
+TIMEOUT_GRACE = 5
+# answers to recent requests kept, so the same request again is answered without searching
+CACHE_SIZE = 256
+
+# each worker process keeps one ScheduleMaker, so the catalog is indexed once per process
+service_maker = None
+service_defaults = None
+
+def is_count(value, lowest=0):
+    # a whole number of at least lowest, which json's true and false aren't
+    return isinstance(value, int) and not isinstance(value, bool) and value >= lowest
+
+def check_strings(name, value):
+    if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+        raise ValueError(f"{name} must be a list of strings")
+
+def check_option(name, value):
+    if name in ['limit', 'top_k']:
+        if not is_count(value, 1) or value > MAX_SCHEDULES:
+            raise ValueError(f"{name} must be a whole number from 1 to {MAX_SCHEDULES}")
+    elif name == 'per_combo':
+        if value is not None and not is_count(value, 1):
+            raise ValueError("per_combo must be null or a whole number of at least 1")
+    elif name == 'by':
+        if value not in [None, 'Course', 'Department']:
+            raise ValueError("by must be null, 'Course' or 'Department'")
+
+def check_param(name, value):
+    # the types ScheduleMaker expects for each parameter, which it doesn't check itself
+    if name == 'num_courses':
+        if not is_count(value, 1):
+            raise ValueError("num_courses must be a whole number of at least 1")
+    elif name in ['must_haves', 'exclude']:
+        check_strings(name, value)
+    elif name in ['at_least', 'must_select', 'at_most']:
+        if not isinstance(value, list) or not all(isinstance(rule, dict) and set(rule) == {'Courses', 'Number'} for rule in value):
+            raise ValueError(f"{name} must be a list of {{\"Courses\": [...], \"Number\": n}}")
+        for rule in value:
+            check_strings(f"{name} Courses", rule['Courses'])
+            if not is_count(rule['Number']):
+                raise ValueError(f"{name} Number must be a whole number")
+    elif name in ['unique_deps', 'unique_listings']:
+        if not isinstance(value, bool):
+            raise ValueError(f"{name} must be true or false")
+    elif name == 'day_limits':
+        if not isinstance(value, dict) or not all(day in DAYS and is_count(day_limit) for day, day_limit in value.items()):
+            raise ValueError(f"day_limits must map days of {DAYS} to whole numbers")
+    elif name == 'time_limits':
+        if not isinstance(value, list) or not all(isinstance(time_limit, (list, tuple)) and len(time_limit) == 2 for time_limit in value):
+            raise ValueError("time_limits must be a list of [start, end] pairs")
+        for time_limit in value:
+            for moment in time_limit:
+                try:
+                    datetime.datetime.strptime(moment, '%I:%M %p')
+                except (TypeError, ValueError):
+                    raise ValueError(f"time limit {moment} isn't a time like '9:30 AM'")
+    elif name == 'preferences':
+        if not isinstance(value, dict):
+            raise ValueError("preferences must map preference names to weights")
+        for scorer, weight in value.items():
+            if scorer not in SCORERS:
+                raise ValueError(f"unknown preference {scorer}, expected one of {list(SCORERS)}")
+            if not isinstance(weight, (int, float)) or isinstance(weight, bool):
+                raise ValueError(f"the weight of {scorer} must be a number")
+
+def timed_out(signum, frame):
+    raise TimeoutError("request timed out")
+
+def init_service_worker(catalog):
+    global service_maker, service_defaults
+    with contextlib.redirect_stdout(io.StringIO()):
+        service_maker = ScheduleMaker(catalog)
+    service_defaults = copy.deepcopy(service_maker.params)
+    if hasattr(signal, 'setitimer'):
+        signal.signal(signal.SIGALRM, timed_out)
+
+def service_worker(action, params, options, timeout):
+    # runs a request on the worker's maker and returns its answer as catalog rows, stopping it
+    # with a TimeoutError when it runs past timeout where the platform has interval timers
+    maker = service_maker
+    maker.params = copy.deepcopy(service_defaults)
+    maker.params.update(params)
+
+    if hasattr(signal, 'setitimer'):
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            if action == 'schedules':
+                count = maker.generate_schedules(limit=options['limit'], per_combo=options['per_combo'])
+                return {'rows': [maker.results.schedule_rows(index) for index in range(count)]}
+            elif action == 'best':
+                count = maker.best_schedules(top_k=options['top_k'], per_combo=options['per_combo'])
+                return {'rows': [maker.results.schedule_rows(index) for index in range(count)], 'scores': maker.scores}
+            else:
+                counts = maker.count_schedules(by=options['by'])
+                return {'counts': counts if options['by'] is None else counts.to_dict('records')}
+    finally:
+        if hasattr(signal, 'setitimer'):
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        maker.results = None
+
+class ScheduleService:
+    # answers requests for the catalog it was started with, running them on a pool of worker
+    # processes. identical requests are answered from a cache, or wait for the same run when one
+    # is already going, and each request is stopped after its timeout
+    def __init__(self, catalog, workers=None, cache_size=CACHE_SIZE, default_timeout=DEFAULT_TIMEOUT):
+        with contextlib.redirect_stdout(io.StringIO()):
+            maker = ScheduleMaker(catalog)
+        self.catalog = maker.catalog
+        self.records = self.catalog.to_frame().to_dict('records')
+        self.default_timeout = default_timeout
+
+        self.workers = workers if workers is not None else os.cpu_count()
+        self.executor = concurrent.futures.ProcessPoolExecutor(self.workers, initializer=init_service_worker, initargs=(self.catalog,))
+
+        self.cache = collections.OrderedDict()
+        self.cache_size = cache_size
+        self.running = dict()
+        # reentrant, since a run that is already done calls __finish while handle holds it
+        self.lock = threading.RLock()
+        self.stats = collections.Counter()
+
+    def __parse(self, action, request):
+        # the parameters and options of a request, the ones it leaves out filled in with their
+        # defaults. anything of the wrong type or out of range raises a ValueError here, which
+        # handle answers with a 400, rather than failing in a worker
+        if action not in ACTIONS:
+            raise ValueError(f"unknown action {action}, expected one of {list(ACTIONS)}")
+        if not isinstance(request, dict):
+            raise ValueError("a request is a json object of parameters and options")
+
+        request = dict(request)
+        timeout = request.pop('timeout', None)
+        timeout = self.default_timeout if timeout is None else timeout
+        if not isinstance(timeout, (int, float)) or not 0 < timeout <= MAX_TIMEOUT:
+            raise ValueError(f"timeout must be a number of seconds up to {MAX_TIMEOUT}")
+
+        options = dict(ACTIONS[action])
+        params = dict()
+        for key, value in request.items():
+            if key in options:
+                check_option(key, value)
+                options[key] = value
+            elif key in PARAMS:
+                check_param(key, value)
+                params[PARAMS[key]] = value
+            else:
+                raise ValueError(f"unknown parameter {key} for {action}")
+
+        if 'time_limits' in params:
+            params['time_limits'] = [tuple(time_limit) for time_limit in params['time_limits']]
+        return params, options, timeout
+
+    def __answer(self, result):
+        # rows become the sections the way the catalog lists them
+        answer = dict(result)
+        if 'rows' in answer:
+            answer['schedules'] = [[self.records[row] for row in rows] for rows in answer.pop('rows')]
+            answer['count'] = len(answer['schedules'])
+        return answer
+
+    def handle(self, action, request):
+        # (http status, json answer) for a request
+        start = time.perf_counter()
+        try:
+            params, options, timeout = self.__parse(action, request)
+        except ValueError as error:
+            return 400, {'error': str(error)}
+
+        key = json.dumps([action, params, options], sort_keys=True, default=str)
+        with self.lock:
+            self.stats['requests'] += 1
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                self.stats['cache hits'] += 1
+                return 200, dict(self.cache[key], cached=True, seconds=time.perf_counter() - start)
+            future = self.running.get(key)
+            if future is None:
+                future = self.executor.submit(service_worker, action, params, options, timeout)
+                self.running[key] = future
+                future.add_done_callback(lambda done: self.__finish(key, done))
+            else:
+                self.stats['joined running'] += 1
+
+        try:
+            answer = self.__answer(future.result(timeout + TIMEOUT_GRACE))
+        except (TimeoutError, concurrent.futures.CancelledError):
+            # a run still waiting for a worker is dropped rather than searched for no one
+            future.cancel()
+            self.stats['timeouts'] += 1
+            return 504, {'error': f"request took longer than {timeout} seconds"}
+        except ValueError as error:
+            return 400, {'error': str(error)}
+        except Exception as error:
+            self.stats['errors'] += 1
+            return 500, {'error': f"{type(error).__name__}: {error}"}
+
+        return 200, dict(answer, cached=False, seconds=time.perf_counter() - start)
+
+    def __finish(self, key, future):
+        # finished runs go into the cache, unless they failed
+        with self.lock:
+            self.running.pop(key, None)
+            if future.cancelled() or future.exception() is not None:
+                return
+            self.cache[key] = self.__answer(future.result())
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def health(self):
+        with self.lock:
+            return {'sections': len(self.catalog), 'courses': len(self.catalog.courses), 'departments': list(self.catalog.departments), 'workers': self.workers,
+                    'cached': len(self.cache), 'running': len(self.running), 'stats': dict(self.stats)}
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
+
+def make_handler(service):
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def address_string(self):
+            # unix socket clients have no address
+            return str(self.client_address[0]) if self.client_address else 'local'
+
+        def send_json(self, status, answer):
+            body = json.dumps(answer).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/health':
+                self.send_json(200, service.health())
+            else:
+                self.send_json(404, {'error': f"no such path {self.path}"})
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            try:
+                request = json.loads(self.rfile.read(length) or b'{}')
+            except ValueError:
+                self.send_json(400, {'error': "the request body isn't json"})
+                return
+            self.send_json(*service.handle(self.path.strip('/'), request))
+
+    return Handler
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+# unix sockets aren't available everywhere (e.g. on windows), so their classes only exist where they are
+if hasattr(socket, 'AF_UNIX'):
+    class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+    class UnixHTTPConnection(http.client.HTTPConnection):
+        def __init__(self, socket_path, timeout=None):
+            super().__init__('localhost', timeout=timeout)
+            self.socket_path = socket_path
+
+        def connect(self):
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.settimeout(self.timeout)
+            self.sock.connect(self.socket_path)
+
+def check_unix_sockets():
+    if not hasattr(socket, 'AF_UNIX'):
+        raise ValueError("unix sockets aren't supported on this platform, use a host and port instead")
+
+def make_server(service, port=8765, host='127.0.0.1', socket_path=None):
+    # http on localhost, or on a unix socket when socket_path is given
+    if socket_path is not None:
+        check_unix_sockets()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        return ThreadingUnixHTTPServer(socket_path, make_handler(service))
+    return ThreadingHTTPServer((host, port), make_handler(service))
+
+class ScheduleClient:
+    # talks to a running service over http, or its unix socket when given a path, with one
+    # connection per call so a client can be shared between threads
+    def __init__(self, url='http://127.0.0.1:8765', socket_path=None):
+        if socket_path is not None:
+            check_unix_sockets()
+        self.url = url
+        self.socket_path = socket_path
+
+    def __connection(self, timeout):
+        if self.socket_path is not None:
+            return UnixHTTPConnection(self.socket_path, timeout)
+        host, port = self.url.split('://', 1)[-1].rstrip('/').split(':')
+        return http.client.HTTPConnection(host, int(port), timeout=timeout)
+
+    def request(self, method, path, body=None):
+        timeout = MAX_TIMEOUT + TIMEOUT_GRACE + 5
+        connection = self.__connection(timeout)
+        try:
+            data = None if body is None else json.dumps(body).encode()
+            connection.request(method, path, body=data, headers={'Content-Type': 'application/json'})
+            response = connection.getresponse()
+            answer = json.loads(response.read())
+        finally:
+            connection.close()
+
+        if response.status == 400:
+            raise ValueError(answer['error'])
+        if response.status == 504:
+            raise TimeoutError(answer['error'])
+        if response.status != 200:
+            raise RuntimeError(answer['error'])
+        return answer
+
+    def schedules(self, limit=100, per_combo=1, timeout=None, **params):
+        # up to limit schedules as lists of their sections, along with whether the answer was cached
+        return self.request('POST', '/schedules', dict(params, limit=limit, per_combo=per_combo, timeout=timeout))
+
+    def best(self, top_k=10, per_combo=None, timeout=None, **params):
+        return self.request('POST', '/best', dict(params, top_k=top_k, per_combo=per_combo, timeout=timeout))
+
+    def count(self, by=None, timeout=None, **params):
+        return self.request('POST', '/count', dict(params, by=by, timeout=timeout))
+
+    def health(self):
+        return self.request('GET', '/health')
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve schedules for one catalog to many users at once")
+    parser.add_argument('catalog', nargs='?', default='schedules.xlsx', help="xlsx, .db/.sqlite store or .catalog file")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--socket', help="serve on this unix socket instead of a port")
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--cache-size', type=int, default=CACHE_SIZE)
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT, help="seconds a request may run when it doesn't say")
+    args = parser.parse_args()
+    if args.socket is not None and not hasattr(socket, 'AF_UNIX'):
+        parser.error("--socket needs unix sockets, which this platform doesn't support")
+
+    service = ScheduleService(args.catalog, args.workers, args.cache_size, args.timeout)
+    server = make_server(service, args.port, args.host, args.socket)
+    print(f"Serving {len(service.catalog)} sections on {args.socket or f'http://{args.host}:{args.port}'} with {service.workers} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+if __name__ == '__main__':
+    main()
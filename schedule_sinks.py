@@ -0,0 +1,156 @@
+import importlib.util
+import json
+import os
+import time
+import pandas as pd
+
+# a checkpoint is written at least this often, in seconds and in schedules, so an interrupted run
+# loses at most that much work and a parquet sink holds at most that many schedules in memory
+CHECKPOINT_INTERVAL = 30
+CHECKPOINT_SCHEDULES = 10000
+
+CHECKPOINT_FILENAME = 'checkpoint.json'
+JSONL_FILENAME = 'schedules.jsonl'
+
+def read_checkpoint(directory):
+    path = os.path.join(directory, CHECKPOINT_FILENAME)
+    if not os.path.exists(path):
+        return None
+    with open(path) as checkpoint_file:
+        return json.load(checkpoint_file)
+
+def write_checkpoint(directory, checkpoint):
+    # written next to the old one and moved over it, so there is always a whole checkpoint
+    path = os.path.join(directory, CHECKPOINT_FILENAME)
+    with open(path + '.tmp', 'w') as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file, indent=1)
+        checkpoint_file.flush()
+        os.fsync(checkpoint_file.fileno())
+    os.replace(path + '.tmp', path)
+
+class JsonlSink:
+    # appends every schedule to schedules.jsonl as a line of its catalog rows and sections as soon
+    # as it is found. a checkpoint records how far the file is whole along with the search
+    # position, anything after that is cut off when the run is resumed
+    def __init__(self, directory, records, run, checkpoint=None):
+        self.directory = directory
+        # each row's section is encoded once and pasted into every line it is part of
+        self.sections = [json.dumps(record).encode() for record in records]
+        self.path = os.path.join(directory, JSONL_FILENAME)
+
+        if checkpoint is None:
+            self.checkpoint = dict(run, Format='jsonl', Combinations=0, Schedules=0, Offset=0, Complete=False)
+            self.file = open(self.path, 'wb')
+        else:
+            self.checkpoint = checkpoint
+            self.file = open(self.path, 'r+b' if os.path.exists(self.path) else 'wb')
+            self.file.truncate(checkpoint['Offset'])
+            self.file.seek(checkpoint['Offset'])
+
+        self.marked = {key: self.checkpoint[key] for key in ['Combinations', 'Schedules', 'Offset']}
+        self.last_checkpoint = time.monotonic()
+
+    def add(self, index, schedule):
+        rows = ', '.join(map(str, schedule))
+        sections = b', '.join(self.sections[row] for row in schedule)
+        self.file.write(f'{{"Schedule": {index}, "Rows": [{rows}], "Sections": ['.encode() + sections + b']}\n')
+
+    def mark(self, combinations, schedules):
+        # the search is done with this many combinations and has found this many schedules
+        self.marked = {'Combinations': combinations, 'Schedules': schedules, 'Offset': self.file.tell()}
+        if schedules - self.checkpoint['Schedules'] >= CHECKPOINT_SCHEDULES or time.monotonic() - self.last_checkpoint >= CHECKPOINT_INTERVAL:
+            self.save()
+
+    def save(self, complete=False):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.checkpoint.update(self.marked, Complete=complete)
+        write_checkpoint(self.directory, self.checkpoint)
+        self.last_checkpoint = time.monotonic()
+
+    def close(self, complete=False, keep=False):
+        # schedules found after the last mark belong to a combination that isn't done, so they
+        # are searched again on resume. they are dropped, or with keep left after the checkpoint
+        # for this run's results, the way a run stopped by its limit still returns them
+        if not keep:
+            self.file.truncate(self.marked['Offset'])
+        self.save(complete)
+        self.file.close()
+
+def iter_jsonl(directory, checkpoint, count):
+    with open(os.path.join(directory, JSONL_FILENAME), 'rb') as jsonl_file:
+        for index in range(count):
+            yield tuple(json.loads(jsonl_file.readline())['Rows'])
+
+class ParquetSink:
+    # the schedules one section a row, written as a new part file at every checkpoint. parts
+    # after the last checkpoint are deleted when the run is resumed
+    def __init__(self, directory, records, run, checkpoint=None):
+        if importlib.util.find_spec('pyarrow') is None and importlib.util.find_spec('fastparquet') is None:
+            raise ValueError("a parquet sink needs pyarrow or fastparquet installed, use 'jsonl' instead")
+
+        self.directory = directory
+        self.records = records
+
+        if checkpoint is None:
+            self.checkpoint = dict(run, Format='parquet', Combinations=0, Schedules=0, Parts=0, Complete=False)
+        else:
+            self.checkpoint = checkpoint
+        for filename in os.listdir(directory):
+            if filename.startswith('schedules-') and filename.endswith('.parquet') and int(filename[10:-8]) >= self.checkpoint['Parts']:
+                os.remove(os.path.join(directory, filename))
+
+        self.rows = []
+        self.marked = {key: self.checkpoint[key] for key in ['Combinations', 'Schedules']}
+        self.marked_rows = 0
+        self.last_checkpoint = time.monotonic()
+
+    def add(self, index, schedule):
+        for row in schedule:
+            record = dict(self.records[row])
+            record['Days'] = str(record['Days'])
+            self.rows.append(dict(Schedule=index, Row=row, **record))
+
+    def mark(self, combinations, schedules):
+        self.marked = {'Combinations': combinations, 'Schedules': schedules}
+        self.marked_rows = len(self.rows)
+        if schedules - self.checkpoint['Schedules'] >= CHECKPOINT_SCHEDULES or time.monotonic() - self.last_checkpoint >= CHECKPOINT_INTERVAL:
+            self.save()
+
+    def save(self, complete=False):
+        parts = self.checkpoint['Parts']
+        if self.marked_rows:
+            pd.DataFrame(self.rows[:self.marked_rows]).to_parquet(os.path.join(self.directory, f"schedules-{parts:05}.parquet"), index=False)
+            parts += 1
+        del self.rows[:self.marked_rows]
+        self.marked_rows = 0
+
+        # parts after Parts up to Written Parts only hold schedules kept by close
+        self.checkpoint.update(self.marked, Parts=parts, Complete=complete)
+        self.checkpoint['Written Parts'] = parts
+        write_checkpoint(self.directory, self.checkpoint)
+        self.last_checkpoint = time.monotonic()
+
+    def close(self, complete=False, keep=False):
+        # see JsonlSink.close, the schedules after the last mark are kept as one more part that
+        # resuming deletes
+        self.save(complete)
+        if keep and self.rows:
+            pd.DataFrame(self.rows).to_parquet(os.path.join(self.directory, f"schedules-{self.checkpoint['Parts']:05}.parquet"), index=False)
+            self.checkpoint['Written Parts'] = self.checkpoint['Parts'] + 1
+            write_checkpoint(self.directory, self.checkpoint)
+        self.rows = []
+
+def iter_parquet(directory, checkpoint, count):
+    for part in range(checkpoint.get('Written Parts', checkpoint['Parts'])):
+        frame = pd.read_parquet(os.path.join(directory, f"schedules-{part:05}.parquet"), columns=['Schedule', 'Row'])
+        for index, rows in frame.groupby('Schedule', sort=False)['Row']:
+            if count <= 0:
+                return
+            count -= 1
+            yield tuple(rows.tolist())
+
+SINKS = {
+    'jsonl': (JsonlSink, iter_jsonl),
+    'parquet': (ParquetSink, iter_parquet)
+}
@@ -0,0 +1,171 @@
+import cProfile
+import collections
+import contextlib
+import io
+import logging
+import pstats
+import time
+import tracemalloc
+
+# hit rates worth reporting, as (name, counter of hits, counters that add up to all attempts)
+HIT_RATES = [
+    ('graph cache', 'graph reused', ['graph reused', 'graph built']),
+    ('combinations with schedules', 'combinations with schedules', ['combinations searched']),
+    ('sections placed', 'sections placed', ['sections tried', 'pruned: time limit', 'pruned: overlap', 'pruned: day limit']),
+    ('schedules kept when ranking', 'ranked kept', ['ranked offered']),
+    ('count states merged', 'count states merged', ['count placements']),
+    ('images reused', 'images reused', ['images reused', 'images drawn'])
+]
+
+def derived_counters(counters):
+    # the section search only tries sections still possible alongside the ones already placed,
+    # so every section tried is placed unless the ranking bound stops it. the sections the time
+    # limits and forward checking took out before they could be tried are counted apart, so
+    # the placed rate is out of all of them
+    derived = dict()
+    if 'sections tried' in counters:
+        derived['sections placed'] = counters['sections tried'] - counters['pruned: ranking bound']
+    return derived
+
+class SearchMetrics:
+    # wall time per phase and counters for what the search did, reported to any callbacks as it
+    # goes. phases can nest (the day limit check is part of the section search), so their times
+    # don't add up to the total
+    def __init__(self):
+        self.callbacks = []
+        self.cpu = False
+        self.memory = False
+        # time the propagation step made for every section placed, which slows the search down
+        self.detailed = False
+        self.reset()
+
+    def reset(self):
+        self.timings = collections.defaultdict(float)
+        self.counters = collections.Counter()
+        self.profiles = dict()
+
+    def add_callback(self, callback):
+        # callback(event, data) gets 'phase', 'progress' and 'done' events with a dict of details
+        self.callbacks.append(callback)
+
+    def emit(self, event, **data):
+        for callback in self.callbacks:
+            callback(event, data)
+
+    def capture(self, cpu=True, memory=False, detailed=False):
+        # profile the next searches and drawings with cProfile and/or tracemalloc, and/or time
+        # the propagation steps
+        self.cpu = cpu
+        self.memory = memory
+        self.detailed = detailed
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.timings[name] += elapsed
+            self.emit('phase', phase=name, seconds=elapsed)
+
+    def timed_iter(self, name, iterable):
+        # the time spent producing each item counts toward the phase, not the time the caller
+        # spends on it
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.timings[name] += time.perf_counter() - start
+                return
+            self.timings[name] += time.perf_counter() - start
+            yield item
+
+    def merge(self, timings, counters):
+        # adds what a worker process measured
+        for name, seconds in timings.items():
+            self.timings[name] += seconds
+        self.counters.update(counters)
+
+    def take(self):
+        # what was measured since the last take, for sending back from a worker process
+        timings, counters = dict(self.timings), dict(self.counters)
+        self.timings.clear()
+        self.counters.clear()
+        return timings, counters
+
+    @contextlib.contextmanager
+    def profiled(self, name):
+        # runs the block as a phase, under cProfile and tracemalloc when capture asked for them
+        profiler = None
+        if self.cpu:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        started_tracing = self.memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+
+        try:
+            with self.phase(name):
+                yield
+        finally:
+            profile = dict()
+            if profiler is not None:
+                profiler.disable()
+                stream = io.StringIO()
+                pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(25)
+                profile['cpu'] = stream.getvalue()
+            if self.memory:
+                snapshot = tracemalloc.take_snapshot()
+                current, peak = tracemalloc.get_traced_memory()
+                profile['memory'] = {'current': current, 'peak': peak, 'top': [str(stat) for stat in snapshot.statistics('lineno')[:15]]}
+                if started_tracing:
+                    tracemalloc.stop()
+            if profile:
+                self.profiles[name] = profile
+
+    def counts(self):
+        counts = dict(self.counters)
+        counts.update(derived_counters(self.counters))
+        return counts
+
+    def hit_rates(self):
+        counts = self.counts()
+        rates = dict()
+        for name, hits, attempts in HIT_RATES:
+            total = sum(counts.get(attempt, 0) for attempt in attempts)
+            if total:
+                rates[name] = counts.get(hits, 0) / total
+        return rates
+
+    def summary(self):
+        return {'timings': dict(self.timings), 'counters': self.counts(), 'hit_rates': self.hit_rates()}
+
+    def format(self):
+        lines = ['Phase times:']
+        lines += [f"  {name:<32} {seconds:.4f}s" for name, seconds in sorted(self.timings.items(), key=lambda item: -item[1])]
+        lines.append('Counters:')
+        lines += [f"  {name:<32} {count}" for name, count in sorted(self.counts().items())]
+        lines.append('Hit rates:')
+        lines += [f"  {name:<32} {rate:.1%}" for name, rate in self.hit_rates().items()]
+        return '\n'.join(lines)
+
+class PrintCallback:
+    # prints every event, or only some of them
+    def __init__(self, events=('phase', 'progress', 'done')):
+        self.events = events
+
+    def __call__(self, event, data):
+        if event in self.events:
+            print(f"[{event}] " + ', '.join(f"{key}={value}" for key, value in data.items()))
+
+class LoggingCallback:
+    # sends events to a logger, phases and progress at debug level and the end of a run at info
+    def __init__(self, logger=None):
+        self.logger = logger if logger is not None else logging.getLogger('schedules')
+
+    def __call__(self, event, data):
+        level = logging.INFO if event == 'done' else logging.DEBUG
+        self.logger.log(level, "%s %s", event, data)
@@ -0,0 +1,64 @@
+import random
+import string
+import pandas as pd
+
+# how each type of section meets, as (weight, days, minutes long): lectures twice a week for 80
+# minutes or three times for 50, precepts and classes once for 50 or 80, labs once for three hours
+MEETING_PATTERNS = {
+    'L': [(5, ['Monday', 'Wednesday'], 80), (5, ['Tuesday', 'Thursday'], 80), (3, ['Monday', 'Wednesday', 'Friday'], 50), (1, ['Wednesday'], 170)],
+    'P': [(2, ['Monday'], 50), (2, ['Tuesday'], 50), (2, ['Wednesday'], 50), (2, ['Thursday'], 50), (1, ['Friday'], 50), (1, ['Tuesday'], 80), (1, ['Thursday'], 80)],
+    'C': [(1, ['Monday', 'Wednesday'], 50), (1, ['Tuesday', 'Thursday'], 50)],
+    'B': [(1, ['Monday'], 170), (1, ['Tuesday'], 170), (1, ['Wednesday'], 170), (1, ['Thursday'], 170)],
+    'S': [(1, ['Monday'], 170), (1, ['Tuesday'], 170), (1, ['Wednesday'], 170), (1, ['Thursday'], 170), (1, ['Friday'], 170)]
+}
+
+# when sections start, as (weight, minutes after midnight), bunched in the late morning and
+# early afternoon the way the real timetable is
+START_TIMES = [(1, 8 * 60 + 30), (3, 9 * 60 + 30), (4, 10 * 60 + 30), (4, 11 * 60), (2, 12 * 60 + 30), (4, 13 * 60 + 30), (3, 15 * 60), (2, 16 * 60 + 30), (1, 19 * 60 + 30)]
+
+def to_time(minutes):
+    return f"{minutes // 60:02}:{minutes % 60:02}:00"
+
+def make_catalog(departments=10, courses_per_department=8, sections_per_type={'L': (1, 2), 'P': (0, 6), 'C': (0, 0), 'B': (0, 0), 'S': (0, 0)}, seed=0, shared_times=0.0):
+    # a catalog in the same shape as schedules.xlsx. sections_per_type maps a section type to how
+    # many sections each course has of it, either a number or a (fewest, most) range. every
+    # course has at least one section. shared_times is the chance a section meets at the same
+    # time as an earlier one of its type, the way several precepts of a course often do
+    generator = random.Random(seed)
+
+    names = set()
+    while len(names) < departments:
+        names.add(''.join(generator.choice(string.ascii_uppercase) for letter in range(3)))
+
+    rows = []
+    for department in sorted(names):
+        numbers = generator.sample(range(100, 500), courses_per_department)
+        for number in sorted(numbers):
+            sections = []
+            for section_type, count in sections_per_type.items():
+                if isinstance(count, tuple):
+                    count = generator.randint(*count)
+                sections += [(section_type, index) for index in range(1, count + 1)]
+            if not sections:
+                sections = [('L', 1)]
+
+            times = dict()
+            for section_type, index in sections:
+                weights, days, length = zip(*MEETING_PATTERNS[section_type])
+                if shared_times and section_type in times and generator.random() < shared_times:
+                    pattern, start = generator.choice(times[section_type])
+                else:
+                    pattern = generator.choices(range(len(weights)), weights=weights)[0]
+                    start = generator.choices([start for weight, start in START_TIMES], weights=[weight for weight, start in START_TIMES])[0]
+                times.setdefault(section_type, []).append((pattern, start))
+                rows.append({
+                    'Department': department,
+                    'Course': number,
+                    'Name': f"{department} {number} Synthetic Course",
+                    'Section': f"{section_type}{index:02}",
+                    'Days': str(days[pattern]),
+                    'Start': to_time(start),
+                    'End': to_time(start + length[pattern])
+                })
+
+    return pd.DataFrame(rows, columns=['Department', 'Course', 'Name', 'Section', 'Days', 'Start', 'End'])